@@ -0,0 +1,117 @@
+import asyncio
+import httpx
+from api.base_api import BaseAPI
+from utils.metrics_utils import RequestTimer
+from utils.cassette_utils import get_cassette
+from utils.log_utils import logger
+
+
+async def gather_with_limit(aws, concurrency=20, return_exceptions=False):
+    """并发执行协程，限制同时进行的数量，结果按传入顺序返回"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(aw):
+        async with semaphore:
+            return await aw
+
+    return await asyncio.gather(*(run(aw) for aw in aws), return_exceptions=return_exceptions)
+
+
+class AsyncBaseAPI(BaseAPI):
+    """异步基础接口类，与BaseAPI共用URL拼接、日志和加解密逻辑"""
+
+    def __init__(self, env_config):
+        super().__init__(env_config)
+        self.max_connections = self.pool_config.get("async_max_connections", 100)
+        self.keep_alive = self.pool_config.get("keep_alive", True)
+        self.client = None
+
+    def _get_client(self):
+        """获取连接池化的异步HTTP客户端（懒加载）"""
+        if self.client is None or self.client.is_closed:
+            self.client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections if self.keep_alive else 0
+                )
+            )
+        return self.client
+
+    async def request(self, method, url, endpoint=None, **kwargs):
+        """异步通用请求方法，带日志记录、加解密和分阶段计时"""
+        timer = RequestTimer()
+        response = None
+        status = None
+        try:
+            full_url = self._build_url(url)
+            kwargs = self._merge_headers(kwargs)
+
+            # 记录请求日志（加密前的明文，已脱敏）
+            with timer.phase("log"):
+                self._log_request(method, full_url, **kwargs)
+
+            # 录制/回放模式（--http-mode）
+            cassette = get_cassette()
+            key = self._cassette_key(cassette, method, full_url, kwargs)
+            if cassette is not None and cassette.mode == "replay":
+                record = self._replay(cassette, key, method, full_url, timer)
+                status = record["status"]
+                if record["error"]:
+                    raise self._replay_error(record, method, full_url)
+                return record["result"]
+
+            kwargs = self._encrypt_payload(kwargs, timer)
+
+            # 发送请求
+            try:
+                with timer.phase("http"):
+                    response = await self._get_client().request(method=method, url=full_url, **kwargs)
+                response.raise_for_status()  # 抛出HTTP错误
+            except httpx.HTTPError as e:
+                logger.error(f"请求异常：{str(e)}")
+                self._record_error(cassette, key, method, full_url, e)
+                raise
+
+            # 记录响应日志
+            with timer.phase("serialize"):
+                response_data = self._load_json(response)
+            with timer.phase("log"):
+                self._log_response(response, response_data)
+
+            # 响应数据解密
+            result = self._parse_response(response, response_data, timer)
+            if cassette is not None:
+                cassette.record(key, method, full_url, response.status_code, result)
+            return result
+        finally:
+            # httpx的elapsed包含响应体读取，不作为首字节时间；并发时http阶段包含事件循环调度等待
+            self._record_timing(method, url, endpoint, timer, response, status=status)
+
+    @staticmethod
+    def _replay_error(record, method, url):
+        """按录制数据重建httpx响应，返回与真实请求一致的HTTPStatusError"""
+        request = httpx.Request(method, url)
+        response = httpx.Response(
+            record["status"], headers=record.get("headers") or {},
+            content=(record.get("body") or "").encode("utf-8"), request=request
+        )
+        return httpx.HTTPStatusError(record["error"], request=request, response=response)
+
+    async def gather(self, aws, concurrency=20, return_exceptions=False):
+        """批量并发请求，concurrency为最大并发数，aws可为任意可迭代对象（含生成器）"""
+        aws = list(aws)
+        logger.info(f"批量并发请求: 数量={len(aws)}, 并发上限={concurrency}")
+        return await gather_with_limit(aws, concurrency, return_exceptions)
+
+    async def close(self):
+        """关闭异步客户端"""
+        if self.client and not self.client.is_closed:
+            await self.client.aclose()
+            logger.info("异步HTTP客户端已关闭")
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
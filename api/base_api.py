@@ -1,7 +1,11 @@
 import requests
 import json
+import logging
 from utils.crypto_utils import CryptoUtils
-from utils.log_utils import logger
+from utils.http_utils import create_session
+from utils.metrics_utils import RequestTimer, endpoint_template, request_metrics
+from utils.cassette_utils import get_cassette, request_key
+from utils.log_utils import logger, mask_sensitive_data, truncate_json, is_log_sampled, DEFAULT_MASK_PATHS
 
 class BaseAPI:
     def __init__(self, env_config):
@@ -10,29 +14,45 @@ class BaseAPI:
         self.headers = env_config.get("headers", {})
         self.encrypt_enabled = env_config.get("encrypt_enabled", False)
         self.crypto = CryptoUtils()
-        self.session = requests.Session()  # 保持会话
+        self.pool_config = env_config.get("pool", {})
+        self.session = create_session(self.pool_config)  # 保持会话，连接池在进程内共享
+        log_config = env_config.get("log", {})
+        self.mask_paths = log_config.get("mask_paths", DEFAULT_MASK_PATHS)
+        # 请求日志的json/data/headers位于下一层级，脱敏路径相应加前缀
+        self.request_mask_paths = [
+            f"{field}.{path}" for field in ("json", "data", "headers") for path in self.mask_paths
+        ]
+        self.max_log_length = log_config.get("max_body_length", 2000)
+        self.last_timing = None  # 最近一次请求的分阶段耗时
 
-    @staticmethod
-    def _log_response(self, response):
-        """记录响应信息"""
-        try:
-            response_data = response.json()
+    def _log_response(self, response, response_data=None):
+        """记录响应信息（DEBUG未启用或未被采样时直接返回，不做任何序列化）"""
+        if not logger.isEnabledFor(logging.DEBUG) or not is_log_sampled():
+            return
+
+        response_time = f"{response.elapsed.total_seconds():.3f}s"
+        if response_data is not None:
             log_data = {
                 "status_code": response.status_code,
-                "headers": dict(response.headers),
-                "response_time": f"{response.elapsed.total_seconds():.3f}s",
-                "data": response_data
+                "headers": mask_sensitive_data(dict(response.headers), self.mask_paths),
+                "response_time": response_time,
+                "data": mask_sensitive_data(response_data, self.mask_paths)
             }
-            logger.debug(f"收到响应：{json.dumps(log_data, ensure_ascii=False)}")
-        except:
+            body = truncate_json(log_data, self.max_log_length, size_hint=len(response.content))
+            logger.debug(f"收到响应：{body}")
+        else:
+            text = response.content[:self.max_log_length].decode("utf-8", errors="replace")
             logger.debug(
                 f"收到响应：状态码={response.status_code}, "
-                f"响应时间={response.elapsed.total_seconds():.3f}s, "
-                f"内容={response.text[:500]}..."  # 截断长文本
+                f"响应时间={response_time}, "
+                f"内容={text}..."  # 截断长文本
             )
 
-    def _log_request(self, method, url, params=None, data=None, json=None, headers=None):
-        """记录请求信息"""
+    def _log_request(self, method, url, params=None, data=None, headers=None, **kwargs):
+        """记录请求信息（DEBUG未启用或未被采样时直接返回，不做任何序列化）"""
+        if not logger.isEnabledFor(logging.DEBUG) or not is_log_sampled():
+            return
+
         log_data = {
             "method": method,
             "url": url,
@@ -40,59 +60,163 @@ class BaseAPI:
             "headers": headers or self.headers
         }
 
-        # 处理敏感数据脱敏
-        if json:
-            log_json = json.copy()
-            if "password" in log_json:
-                log_json["password"] = "***"
-            log_data["json"] = log_json
+        json_body = kwargs.get("json")
+        if json_body:
+            log_data["json"] = json_body
         elif data:
             log_data["data"] = data
 
-        logger.debug(f"发送请求：{json.dumps(log_data, ensure_ascii=False)}")
+        # 处理敏感数据脱敏
+        log_data = mask_sensitive_data(log_data, self.request_mask_paths)
+        logger.debug(f"发送请求：{truncate_json(log_data, self.max_log_length)}")
+
+    def _build_url(self, url):
+        """拼接完整URL"""
+        return f"{self.base_url}{url}" if url.startswith("/") else f"{self.base_url}/{url}"
+
+    def _merge_headers(self, kwargs):
+        """公共请求头与接口自定义请求头合并"""
+        kwargs["headers"] = {**self.headers, **(kwargs.get("headers") or {})}
+        return kwargs
 
-    def request(self, method, url, **kwargs):
-        """通用请求方法，带日志记录和加解密"""
-        # 处理完整URL
-        full_url = f"{self.base_url}{url}" if url.startswith("/") else f"{self.base_url}/{url}"
-        
-        # 请求数据加密
+    def _encrypt_payload(self, kwargs, timer):
+        """请求数据加密"""
         if self.encrypt_enabled and "json" in kwargs:
-            kwargs["json"] = {
-                "data": self.crypto.aes_encrypt(json.dumps(kwargs["json"])),
-                "timestamp": self.crypto.get_timestamp()
-            }
-        
-        # 记录请求日志
-        self._log_request(method, full_url,** kwargs)
-        
-        # 发送请求
+            with timer.phase("serialize"):
+                plaintext = json.dumps(kwargs["json"])
+            with timer.phase("encrypt"):
+                kwargs["json"] = {
+                    "data": self.crypto.aes_encrypt(plaintext),
+                    "timestamp": self.crypto.get_timestamp()
+                }
+        return kwargs
+
+    @staticmethod
+    def _load_json(response):
+        """解析响应体，非JSON返回None（每个响应只解析一次）"""
         try:
-            response = self.session.request(
-                method=method,
-                url=full_url,
-                headers=self.headers,
-                timeout=self.timeout,
-                **kwargs
-            )
-            response.raise_for_status()  # 抛出HTTP错误
-        except requests.exceptions.RequestException as e:
-            logger.error(f"请求异常：{str(e)}")
-            raise
-        
-        # 记录响应日志
-        self._log_response(response)
-        
-        # 响应数据解密
+            return response.json()
+        except ValueError:
+            return None
+
+    def _parse_response(self, response, response_data, timer):
+        """处理已解析的响应数据，按需解密"""
+        if response_data is None:
+            return {"status_code": response.status_code, "text": response.text}
         try:
-            response_data = response.json()
             if self.encrypt_enabled and "data" in response_data:
-                decrypted_data = self.crypto.aes_decrypt(response_data["data"])
-                response_data["data"] = json.loads(decrypted_data)
+                with timer.phase("decrypt"):
+                    decrypted_data = self.crypto.aes_decrypt(response_data["data"])
+                with timer.phase("serialize"):
+                    response_data["data"] = json.loads(decrypted_data)
             return response_data
         except:
             return {"status_code": response.status_code, "text": response.text}
 
+    def _record_timing(self, method, url, endpoint, timer, response, ttfb=None, status=None):
+        """汇总本次请求的分阶段耗时，按接口模板聚合"""
+        timings = timer.finish(ttfb)
+        self.last_timing = timings
+        if status is None:
+            status = response.status_code if response is not None else "error"
+        request_metrics.record(method, endpoint or endpoint_template(url), timings, status)
+        return timings
+
+    @staticmethod
+    def _cassette_key(cassette, method, url, kwargs):
+        """录制/回放模式下计算请求索引键（完整URL + 加密前的明文），不同base_url的录制互不混用"""
+        if cassette is None:
+            return None
+        return request_key(method, url, kwargs.get("params"), kwargs.get("json"), kwargs.get("data"))
+
+    @staticmethod
+    def _replay(cassette, key, method, url, timer):
+        """回放录制的响应（不发起请求），返回 {"status", "result", "error", "headers", "body"}"""
+        with timer.phase("serialize"):
+            record = cassette.replay(key, method, url)
+        logger.debug(f"回放响应：{method} {url}，状态码={record['status']}")
+        return record
+
+    @staticmethod
+    def _record_error(cassette, key, method, url, error):
+        """录制HTTP错误响应的状态码、响应头和响应体（网络异常不录制）"""
+        response = getattr(error, "response", None)
+        if cassette is not None and cassette.mode == "record" and response is not None:
+            cassette.record(key, method, url, response.status_code, error=str(error),
+                            headers=dict(response.headers), body=response.text)
+
+    @staticmethod
+    def _replay_error(record, method, url):
+        """按录制数据重建响应对象，返回与真实请求一致的HTTPError（e.response可用）"""
+        response = requests.Response()
+        response.status_code = record["status"]
+        response.headers.update(record.get("headers") or {})
+        response._content = (record.get("body") or "").encode("utf-8")
+        response.encoding = "utf-8"
+        response.url = url
+        response.request = requests.Request(method, url).prepare()
+        return requests.exceptions.HTTPError(record["error"], response=response)
+
+    def request(self, method, url, endpoint=None, **kwargs):
+        """通用请求方法，带日志记录、加解密和分阶段计时
+
+        endpoint为统计用的接口模板，默认将路径中的ID类片段替换为{id}
+        """
+        timer = RequestTimer()
+        response = None
+        status = None
+        try:
+            # 处理完整URL
+            full_url = self._build_url(url)
+            kwargs = self._merge_headers(kwargs)
+
+            # 记录请求日志（加密前的明文，已脱敏）
+            with timer.phase("log"):
+                self._log_request(method, full_url, **kwargs)
+
+            # 录制/回放模式（--http-mode）
+            cassette = get_cassette()
+            key = self._cassette_key(cassette, method, full_url, kwargs)
+            if cassette is not None and cassette.mode == "replay":
+                record = self._replay(cassette, key, method, full_url, timer)
+                status = record["status"]
+                if record["error"]:
+                    raise self._replay_error(record, method, full_url)
+                return record["result"]
+
+            kwargs = self._encrypt_payload(kwargs, timer)
+
+            # 发送请求
+            try:
+                with timer.phase("http"):
+                    response = self.session.request(
+                        method=method,
+                        url=full_url,
+                        timeout=self.timeout,
+                        **kwargs
+                    )
+                response.raise_for_status()  # 抛出HTTP错误
+            except requests.exceptions.RequestException as e:
+                logger.error(f"请求异常：{str(e)}")
+                self._record_error(cassette, key, method, full_url, e)
+                raise
+
+            # 记录响应日志
+            with timer.phase("serialize"):
+                response_data = self._load_json(response)
+            with timer.phase("log"):
+                self._log_response(response, response_data)
+
+            # 响应数据解密
+            result = self._parse_response(response, response_data, timer)
+            if cassette is not None:
+                cassette.record(key, method, full_url, response.status_code, result)
+            return result
+        finally:
+            # requests的elapsed为发送请求到解析完响应头的时间，即首字节时间
+            ttfb = response.elapsed.total_seconds() if response is not None else None
+            self._record_timing(method, url, endpoint, timer, response, ttfb, status)
+
     def get(self, url,** kwargs):
         return self.request("GET", url, **kwargs)
 
@@ -1,4 +1,5 @@
 from api.base_api import BaseAPI
+from api.async_base_api import AsyncBaseAPI
 from utils.log_utils import logger
 
 class UserAPI(BaseAPI):
@@ -28,3 +29,10 @@ class UserAPI(BaseAPI):
         url = f"{self.base_path}/register"
         logger.info(f"执行用户注册: {user_data['username']}")
         return self.post(url, json=user_data)
+
+
+class AsyncUserAPI(UserAPI, AsyncBaseAPI):
+    """异步用户接口，复用UserAPI的接口定义，方法返回协程
+
+    示例: results = await api.gather([api.get_user_info(uid, token) for uid in user_ids], concurrency=50)
+    """
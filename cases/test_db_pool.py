@@ -0,0 +1,42 @@
+import allure
+import uuid
+from utils.db_utils import quote_identifier
+
+
+@allure.feature("框架自检")
+class TestDBConnectionPool:
+
+    @allure.story("数据库连接池")
+    @allure.title("复用的连接能读到其他连接提交的数据（归还时结束一致性读快照）")
+    def test_reused_connection_sees_committed_rows(self, db_client):
+        pool = db_client.pool
+        table = quote_identifier(f"t_pool_snapshot_{uuid.uuid4().hex[:8]}")
+        with pool.connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(f"CREATE TABLE {table} (id INT PRIMARY KEY)")
+            connection.commit()
+
+        writer = pool._create_connection()
+        try:
+            # 只执行SELECT后归还，建立的一致性读快照不能被下一个使用者沿用
+            with pool.connection() as connection:
+                reader = connection
+                with connection.cursor() as cursor:
+                    cursor.execute(f"SELECT COUNT(*) AS total FROM {table}")
+                    assert cursor.fetchone()["total"] == 0
+
+            with writer.cursor() as cursor:
+                cursor.execute(f"INSERT INTO {table} (id) VALUES (1)")
+            writer.commit()
+
+            # 连接池按后进先出复用，取到的是刚归还的同一个连接
+            with pool.connection() as connection:
+                assert connection is reader, "未复用刚归还的连接"
+                with connection.cursor() as cursor:
+                    cursor.execute(f"SELECT COUNT(*) AS total FROM {table}")
+                    assert cursor.fetchone()["total"] == 1, "复用的连接仍在读取旧快照"
+        finally:
+            with writer.cursor() as cursor:
+                cursor.execute(f"DROP TABLE IF EXISTS {table}")
+            writer.commit()
+            writer.close()
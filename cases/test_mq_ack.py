@@ -0,0 +1,56 @@
+import allure
+import pytest
+from utils.mq_utils import _AckTracker
+
+
+class FakeChannel:
+    """记录ack/nack调用顺序，对已确认/已拒绝的delivery_tag再次确认时模拟Broker的406错误"""
+
+    def __init__(self):
+        self.calls = []
+        self._settled = set()
+
+    def basic_nack(self, delivery_tag, requeue=True):
+        assert delivery_tag not in self._settled, f"406 PRECONDITION_FAILED: unknown delivery tag {delivery_tag}"
+        self._settled.add(delivery_tag)
+        self.calls.append(("nack", delivery_tag))
+
+    def basic_ack(self, delivery_tag, multiple=False):
+        assert delivery_tag not in self._settled, f"406 PRECONDITION_FAILED: unknown delivery tag {delivery_tag}"
+        self._settled.update(range(1, delivery_tag + 1) if multiple else [delivery_tag])
+        self.calls.append(("ack", delivery_tag, multiple))
+
+
+def _flush(settled, failed=()):
+    tracker, channel = _AckTracker(), FakeChannel()
+    for tag in settled:
+        tracker.settle(tag, tag not in failed)
+    return tracker.flush(channel), channel.calls
+
+
+@allure.feature("框架自检")
+class TestAckTracker:
+
+    @allure.story("MQ批量确认")
+    @pytest.mark.parametrize("settled, failed, expected_acked, expected_calls", [
+        ([1], [1], 0, [("nack", 1)]),
+        ([1, 2, 3], [], 3, [("ack", 3, True)]),
+        ([1, 2, 3], [3], 2, [("nack", 3), ("ack", 2, True)]),
+        ([1, 2, 3], [2, 3], 1, [("nack", 2), ("nack", 3), ("ack", 1, True)]),
+        ([1, 2, 3], [1, 2, 3], 0, [("nack", 1), ("nack", 2), ("nack", 3)]),
+        ([1, 2, 3], [2], 2, [("nack", 2), ("ack", 3, True)]),
+    ])
+    def test_flush_call_sequence(self, settled, failed, expected_acked, expected_calls):
+        acked, calls = _flush(settled, failed)
+        assert calls == expected_calls
+        assert acked == expected_acked
+
+    @allure.story("MQ批量确认")
+    def test_failed_tag_beyond_gap(self):
+        tracker, channel = _AckTracker(), FakeChannel()
+        tracker.settle(1, True)
+        tracker.settle(3, False)  # 2尚未处理完，3失败
+        assert tracker.flush(channel) == 1
+        tracker.settle(2, True)
+        assert tracker.flush(channel) == 1
+        assert channel.calls == [("nack", 3), ("ack", 1, True), ("ack", 2, True)]
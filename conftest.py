@@ -1,10 +1,22 @@
 import pytest
 import os
-from utils.config_utils import load_env_config, load_db_config, load_redis_config, load_mq_config
-from utils.db_utils import MySQLClient
-from utils.redis_utils import RedisClient
+import json
+import allure
+from utils.config_utils import load_env_config, load_db_config, load_redis_config, load_mq_config, ReadOnlyDict
+from utils.db_utils import MySQLClient, TableSnapshot
+from utils.seed_utils import DataSeeder
+from utils.redis_utils import RedisClient, default_namespace, get_redis_pool_stats, close_redis_pools
 from utils.mq_utils import RabbitMQClient
-from utils.log_utils import logger, set_case_context, clear_case_context
+from utils.http_utils import get_pool_stats, close_pools
+from utils.wait_utils import configure_wait, consistency_metrics
+from utils.cassette_utils import HTTP_MODES, use_cassette, close_cassette
+from utils.stub_utils import StubServer
+from utils.metrics_utils import (
+    request_metrics, LatencyHistogram, LatencyBudgetExceeded, LatencyBudgetTracker, check_latency_budget
+)
+from utils.log_utils import (
+    logger, set_case_context, clear_case_context, dump_case_logs, flush_logs, merge_worker_logs
+)
 
 # 自定义命令行参数
 def pytest_addoption(parser):
@@ -14,6 +26,61 @@ def pytest_addoption(parser):
         default="test",
         help="指定测试环境：test（默认）/staging/prod"
     )
+    parser.addoption(
+        "--http-mode",
+        action="store",
+        default="passthrough",
+        choices=HTTP_MODES,
+        help="HTTP模式：passthrough（默认，直接请求）/record（请求并录制）/replay（从录制数据回放）"
+    )
+    parser.addoption(
+        "--stub",
+        action="store_true",
+        default=False,
+        help="用例请求指向进程内桩服务（不依赖后端，配置见 config/env.yaml 的 stub 节点）"
+    )
+    parser.addoption(
+        "--cassette-dir",
+        action="store",
+        default=None,
+        help="录制数据目录，默认 data/cassettes/<env>"
+    )
+
+# 延迟预算：参数化用例的各实例汇总为一组
+latency_budgets = LatencyBudgetTracker()
+_budget_group_sizes = {}
+_budget_group_violations = {}
+
+# Allure中将超出延迟预算的失败单独归类
+ALLURE_CATEGORIES = [
+    {"name": "延迟预算超出", "messageRegex": "(?s).*延迟预算超出.*", "matchedStatuses": ["failed"]},
+    {"name": "Product defects", "matchedStatuses": ["failed"]},
+    {"name": "Test defects", "matchedStatuses": ["broken"]}
+]
+
+def pytest_configure(config):
+    # 录制/回放：xdist下由主进程清空旧录制数据，各worker分别写入自己的文件
+    http_mode = config.getoption("--http-mode")
+    if http_mode != "passthrough":
+        cassette_dir = config.getoption("--cassette-dir") or os.path.join(
+            os.path.dirname(__file__), "data", "cassettes", config.getoption("--env")
+        )
+        use_cassette(http_mode, cassette_dir, clear=not hasattr(config, "workerinput"))
+
+    allure_dir = config.getoption("allure_report_dir", None)
+    if allure_dir:
+        os.makedirs(allure_dir, exist_ok=True)
+        with open(os.path.join(allure_dir, "categories.json"), "w", encoding="utf-8") as f:
+            json.dump(ALLURE_CATEGORIES, f, ensure_ascii=False, indent=2)
+
+def _budget_group(item):
+    return item.nodeid.split("[")[0]
+
+def pytest_collection_finish(session):
+    for item in session.items:
+        if item.get_closest_marker("latency_budget"):
+            group = _budget_group(item)
+            _budget_group_sizes[group] = _budget_group_sizes.get(group, 0) + 1
 
 # 核心夹具
 @pytest.fixture(scope="session")
@@ -21,19 +88,88 @@ def env_name(request):
     return request.config.getoption("--env")
 
 @pytest.fixture(scope="session")
-def env_config(env_name):
+def stub_server(env_name):
+    """进程内桩服务（会话级，随机端口，pytest-xdist下每个worker一个）"""
+    server = StubServer(load_env_config(env_name).get("stub"))
+    server.start()
+    yield server
+    server.stop()
+
+@pytest.fixture(scope="session")
+def stub_env_config(env_config, stub_server):
+    """基础URL指向桩服务的环境配置"""
+    return ReadOnlyDict(env_config, base_url=stub_server.base_url)
+
+@pytest.fixture(scope="session")
+def env_config(request, env_name):
     config = load_env_config(env_name)
+    configure_wait(config.get("wait"))
+    if request.config.getoption("--stub"):
+        config = ReadOnlyDict(config, base_url=request.getfixturevalue("stub_server").base_url)
     logger.info(f"加载环境配置：{env_name}，基础URL：{config['base_url']}")
     return config
 
-# 数据层客户端夹具
-@pytest.fixture(scope="class")
+@pytest.fixture(scope="session")
+def db_config(env_name):
+    return load_db_config(env_name)
+
+# 数据层客户端夹具（会话级，pytest-xdist下每个worker一个连接池）
+@pytest.fixture(scope="session")
 def db_client(db_config):
-    logger.info(f"初始化数据库连接：{db_config['host']}:{db_config['port']}")
+    logger.info(f"初始化数据库连接池：{db_config['host']}:{db_config['port']}")
     client = MySQLClient(config=db_config)
     yield client
     client.close()
-    logger.info("关闭数据库连接")
+    logger.info("关闭数据库连接池")
+
+# 数据库隔离夹具（按需使用）：用例在事务中执行，结束后整体回滚
+@pytest.fixture
+def db_transaction(db_client):
+    with db_client.isolated():
+        yield db_client
+
+@pytest.fixture(scope="session")
+def table_snapshot(db_client):
+    snapshot = TableSnapshot(db_client)
+    yield snapshot
+    snapshot.drop()
+
+# 数据库快照夹具：用 @pytest.mark.db_tables("t_user", ...) 声明用例会修改的表，
+# 用例结束后仅对校验和发生变化的表从快照还原
+@pytest.fixture
+def db_snapshot(request, db_client, table_snapshot):
+    marker = request.node.get_closest_marker("db_tables")
+    tables = list(marker.args) if marker else []
+    table_snapshot.track(tables)
+    yield db_client
+    table_snapshot.restore_changed(tables)
+
+# 造数夹具：用例中通过 data_seeder.seed("data/xxx.yaml") 批量造数，用例结束后批量删除
+@pytest.fixture
+def data_seeder(db_client):
+    seeder = DataSeeder(db_client)
+    yield seeder
+    seeder.cleanup()
+    seeder.restore()
+
+@pytest.fixture(scope="session")
+def redis_config(env_name):
+    return load_redis_config(env_name)
+
+# Redis客户端（会话级，不加命名空间，用于校验被测系统写入的键）
+@pytest.fixture(scope="session")
+def redis_client(redis_config):
+    client = RedisClient(config=redis_config)
+    yield client
+    client.close()
+
+# Redis命名空间隔离夹具：键自动加上 test:{运行ID}:{worker} 前缀，用例结束后仅删除本用例写入的键
+@pytest.fixture
+def redis_ns(redis_config):
+    client = RedisClient(config=redis_config, namespace=default_namespace())
+    yield client
+    client.cleanup()
+    client.close()
 
 # 用例级日志上下文管理
 @pytest.fixture(autouse=True)
@@ -46,15 +182,140 @@ def case_log_context(request):
     logger.info(f"用例执行结束：{case_name}，用例ID：{case_id}")
     clear_case_context()
 
+# 延迟预算检查：收集用例执行期间BaseAPI记录的请求耗时，单次请求超出max时当前实例失败；
+# 百分位预算在该组最后一个实例执行后按全组汇总检查（xdist下同组实例分散在多个worker，由主进程在会话结束时检查）
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_call(item):
+    marker = item.get_closest_marker("latency_budget")
+    if marker is None:
+        yield
+        return
+
+    budget = dict(marker.kwargs)
+    phase = budget.pop("phase", "total")
+    endpoint = budget.pop("endpoint", None)
+    samples = LatencyHistogram()
+
+    def collect(method, request_endpoint, timings, status):
+        if (endpoint is None or request_endpoint == endpoint) and phase in timings:
+            samples.record(timings[phase])
+
+    request_metrics.add_listener(collect)
+    try:
+        outcome = yield
+    finally:
+        request_metrics.remove_listener(collect)
+    group = _budget_group(item)
+    if outcome.excinfo is not None or not samples.count:
+        # 功能失败的重跑不保留之前尝试的样本
+        latency_budgets.discard(group, item.nodeid)
+        return
+
+    entry = latency_budgets.add(group, budget, samples, item.nodeid)
+    summary = samples.summary((50, 90, 95, 99))
+    allure.attach(
+        json.dumps({"phase": phase, "budget": budget, "summary": summary}, ensure_ascii=False, indent=2),
+        name="接口耗时(ms)", attachment_type=allure.attachment_type.JSON
+    )
+
+    violations = check_latency_budget(samples, {"max": budget["max"]}) if "max" in budget else []
+    whole_group = len(entry["items"]) == _budget_group_sizes.get(group, 1)
+    if whole_group and (_budget_group_sizes.get(group, 1) == 1 or not hasattr(item.config, "workerinput")):
+        entry["checked"] = True
+        histogram = latency_budgets.histogram(entry)
+        violations = violations or check_latency_budget(histogram, budget)
+        summary = histogram.summary((50, 90, 95, 99))
+    if violations:
+        outcome.force_exception(LatencyBudgetExceeded(
+            f"延迟预算超出（{phase}，{group}，样本数={summary['count']}）: {'，'.join(violations)}"
+        ))
+
+# 超出延迟预算的失败单独归类显示，不与功能失败混在一起（将被重跑的尝试仍显示为rerun）
+def pytest_report_teststatus(report, config):
+    if getattr(report, "latency_budget_exceeded", False) and report.outcome != "rerun":
+        return "latency", "L", "LATENCY"
+
+@pytest.hookimpl(optionalhook=True)
+def pytest_testnodedown(node, error):
+    data = getattr(node, "workeroutput", {}).get("latency_budgets")
+    if data:
+        latency_budgets.merge_dict(data)
+
 # 用例结果记录钩子
 @pytest.hookimpl(tryfirst=True, hookwrapper=True)
 def pytest_runtest_makereport(item, call):
     outcome = yield
     rep = outcome.get_result()
+    if rep.failed:
+        # 失败采集模式下，将用例缓冲的DEBUG日志落盘并附加到报告
+        debug_log = dump_case_logs()
+        if debug_log:
+            rep.sections.append((f"Captured debug log {rep.when}", debug_log))
+            allure.attach(debug_log, name="DEBUG日志", attachment_type=allure.attachment_type.TEXT)
+    rep.latency_budget_exceeded = bool(
+        rep.failed and call.excinfo is not None and call.excinfo.errisinstance(LatencyBudgetExceeded)
+    )
     if rep.when == "call":
-        if rep.failed:
-            logger.error(f"用例执行失败：{item.node.name}，原因：{str(rep.longrepr)}")
+        if rep.latency_budget_exceeded:
+            logger.error(f"用例超出延迟预算：{item.name}，原因：{call.excinfo.value}")
+        elif rep.failed:
+            logger.error(f"用例执行失败：{item.name}，原因：{str(rep.longrepr)}")
         elif rep.passed:
-            logger.info(f"用例执行成功：{item.node.name}")
+            logger.info(f"用例执行成功：{item.name}")
         else:
-            logger.warning(f"用例执行跳过：{item.node.name}")
\ No newline at end of file
+            logger.warning(f"用例执行跳过：{item.name}")
+
+# 会话结束时输出HTTP/Redis连接池统计并释放连接，导出接口耗时统计，日志刷盘并合并各worker日志
+def pytest_sessionfinish(session, exitstatus):
+    for host, stats in get_pool_stats().items():
+        logger.info(
+            f"HTTP连接池统计：{host}，请求数={stats['requests']}，"
+            f"新建连接={stats['opened']}，复用连接={stats['reused']}"
+        )
+    close_pools()
+    for address, stats in get_redis_pool_stats().items():
+        logger.info(
+            f"Redis连接池统计：{address}，使用中={stats['in_use']}，"
+            f"累计创建={stats['created']}，错误={stats['errors']}，获取连接失败={stats['acquire_errors']}"
+        )
+    close_redis_pools()
+    close_cassette()
+    for name, stats in consistency_metrics.stats().items():
+        logger.info(
+            f"最终一致等待统计：{name}，满足={stats['count']}次，超时={stats['timeouts']}次，"
+            f"平均尝试={stats['attempts_avg']}次，耗时p50={stats['p50']}s，p95={stats['p95']}s，max={stats['max']}s"
+        )
+
+    if hasattr(session.config, "workerinput"):
+        # xdist worker：导出接口耗时统计和延迟预算数据，确保日志写完后再通知主进程结束
+        if request_metrics.endpoints:
+            request_metrics.export()
+        session.config.workeroutput["latency_budgets"] = latency_budgets.to_dict()
+        flush_logs()
+    else:
+        # 未在用例中完成检查的分组（xdist分散执行或部分实例失败）在会话结束时按汇总检查
+        _budget_group_violations.update(latency_budgets.evaluate())
+        if _budget_group_violations and session.exitstatus == pytest.ExitCode.OK:
+            session.exitstatus = pytest.ExitCode.TESTS_FAILED
+        request_metrics.merge_worker_exports()
+        if request_metrics.endpoints:
+            json_path, prom_path = request_metrics.export()
+            logger.info(f"接口耗时统计已导出：{json_path}，{prom_path}")
+        merge_worker_logs()
+
+# 终端输出各接口耗时汇总（毫秒），区分网络请求耗时与框架开销
+def pytest_terminal_summary(terminalreporter, exitstatus, config):
+    latency_reports = terminalreporter.stats.get("latency", [])
+    if latency_reports or _budget_group_violations:
+        terminalreporter.write_sep("=", "延迟预算超出", yellow=True)
+        for report in latency_reports:
+            crash = getattr(report.longrepr, "reprcrash", None)
+            terminalreporter.write_line(f"{report.nodeid}: {crash.message if crash else report.longreprtext}")
+        for group, (violations, summary) in _budget_group_violations.items():
+            terminalreporter.write_line(f"{group}（汇总，样本数={summary['count']}）: {'，'.join(violations)}")
+
+    lines = request_metrics.format_table()
+    if lines:
+        terminalreporter.write_sep("-", "接口耗时统计(ms)")
+        for line in lines:
+            terminalreporter.write_line(line)
@@ -1,6 +1,11 @@
-from jsonschema import validate, ValidationError
-from utils.config_utils import load_schema
+import hashlib
+import time
+from datetime import date, datetime
+from decimal import Decimal
 from utils.log_utils import logger
+from utils.schema_utils import schema_registry
+from utils.wait_utils import consistency_metrics, eventually
+from utils.metrics_utils import LatencyBudgetExceeded, LatencyHistogram, check_latency_budget
 
 def assert_response_success(response):
     """断言响应成功（默认code=200, message=success）"""
@@ -34,25 +39,114 @@ def assert_response_contains(response, expected_data):
     else:
         assert expected_data in str(response), f"响应中无数据: {expected_data}"
 
+def _format_schema_errors(errors, max_errors=20):
+    """格式化Schema错误列表，errors为 [(位置前缀, 错误), ...]"""
+    messages = [f"{prefix}{error.json_path}: {error.message}" for prefix, error in errors[:max_errors]]
+    if len(errors) > max_errors:
+        messages.append(f"...共{len(errors)}处错误")
+    return "; ".join(messages)
+
 def assert_schema_match(response, schema_name):
-    """验证响应是否符合JSON Schema"""
-    try:
-        schema = load_schema(schema_name)
-        validate(instance=response, schema=schema)
-        logger.info(f"Schema验证通过: {schema_name}")
-    except ValidationError as e:
-        logger.error(f"Schema验证失败: {str(e)}")
-        raise AssertionError(f"响应不符合Schema规范: {schema_name}, 错误: {str(e)}")
-
-def assert_db_record_exists(db_client, sql, params=None, min_count=1):
-    """断言数据库记录存在"""
+    """验证响应是否符合JSON Schema（一次校验报告全部错误）"""
+    errors = schema_registry.iter_errors(response, schema_name)
+    if errors:
+        message = _format_schema_errors([("", error) for error in errors])
+        logger.error(f"Schema验证失败: {message}")
+        raise AssertionError(f"响应不符合Schema规范: {schema_name}, 错误: {message}")
+    logger.info(f"Schema验证通过: {schema_name}")
+
+def assert_schema_match_many(items, schema_name):
+    """批量验证列表中每一项是否符合JSON Schema（适用于列表接口）"""
+    errors = schema_registry.validate_many(items, schema_name)
+    if errors:
+        message = _format_schema_errors([(f"[{index}]", error) for index, error in errors])
+        logger.error(f"Schema批量验证失败: {message}")
+        raise AssertionError(f"列表数据不符合Schema规范: {schema_name}, 错误: {message}")
+    logger.info(f"Schema批量验证通过: {schema_name}, 共{len(items)}条")
+
+def assert_db_record_exists(db_client, sql, params=None, min_count=1, timeout=None, name="db_record"):
+    """断言数据库记录存在，指定timeout时重试等待直到满足（用于异步写入）"""
+    if timeout is not None:
+        return eventually(lambda: assert_db_record_exists(db_client, sql, params, min_count), timeout, name)
     result = db_client.execute_sql(sql, params)
     assert len(result) >= min_count, \
         f"数据库记录不足，预期至少{min_count}条，实际{len(result)}条，SQL: {sql}"
     return result
 
-def assert_redis_key_exists(redis_client, key, expected_value=None):
-    """断言Redis键存在，可选验证值"""
+def _normalize_value(value):
+    """统一API与数据库的取值表示，如 Decimal('1.50') 与 1.5、datetime 与字符串"""
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return str(int(value))
+    if isinstance(value, (int, float, Decimal)):
+        return format(Decimal(str(value)).normalize(), "f")
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    if isinstance(value, date):
+        return value.isoformat()
+    return str(value)
+
+def _row_fingerprint(row, fields, normalize):
+    """计算行指纹（仅比较指定字段）"""
+    content = "\x1f".join(normalize(row.get(field)) for field in fields)
+    return hashlib.blake2b(content.encode("utf-8"), digest_size=16).digest()
+
+def diff_api_with_db(api_rows, db_client, sql, key, fields=None, params=None,
+                     normalize=_normalize_value, chunk_size=1000, max_samples=20):
+    """按主键比对API列表数据与数据库查询结果
+
+    API侧只保留 主键->指纹 的索引，数据库侧流式读取，两侧都不会完整保留在内存中
+    返回 {"missing": 仅API存在的主键, "extra": 仅数据库存在的主键, "mismatched": 字段不一致的主键,
+          "*_count": 对应数量}，主键列表最多保留max_samples个样本
+    """
+    fields = list(fields) if fields else None
+    api_index = {}
+    for row in api_rows:
+        if fields is None:
+            fields = [field for field in row if field != key]
+        api_index[normalize(row[key])] = _row_fingerprint(row, fields, normalize)
+
+    result = {"missing": [], "extra": [], "mismatched": [],
+              "missing_count": 0, "extra_count": 0, "mismatched_count": 0}
+
+    def record(kind, row_key):
+        result[f"{kind}_count"] += 1
+        if len(result[kind]) < max_samples:
+            result[kind].append(row_key)
+
+    for rows in db_client.stream_query(sql, params, chunk_size):
+        for row in rows:
+            row_key = normalize(row[key])
+            api_fingerprint = api_index.pop(row_key, None)
+            if api_fingerprint is None:
+                record("extra", row_key)
+            elif fields and api_fingerprint != _row_fingerprint(row, fields, normalize):
+                record("mismatched", row_key)
+
+    for row_key in api_index:
+        record("missing", row_key)
+    return result
+
+def assert_api_matches_db(api_rows, db_client, sql, key, fields=None, params=None, **kwargs):
+    """断言API列表数据与数据库查询结果按主键逐行一致"""
+    diff = diff_api_with_db(api_rows, db_client, sql, key, fields, params, **kwargs)
+    if diff["missing_count"] or diff["extra_count"] or diff["mismatched_count"]:
+        message = (
+            f"API与数据库数据不一致，SQL: {sql}；"
+            f"仅API存在{diff['missing_count']}条（样本: {diff['missing']}），"
+            f"仅数据库存在{diff['extra_count']}条（样本: {diff['extra']}），"
+            f"字段不一致{diff['mismatched_count']}条（样本: {diff['mismatched']}）"
+        )
+        logger.error(message)
+        raise AssertionError(message)
+    logger.info(f"API与数据库数据一致，SQL: {sql}")
+    return diff
+
+def assert_redis_key_exists(redis_client, key, expected_value=None, timeout=None, name="redis_key"):
+    """断言Redis键存在，可选验证值，指定timeout时重试等待直到满足"""
+    if timeout is not None:
+        return eventually(lambda: assert_redis_key_exists(redis_client, key, expected_value), timeout, name)
     value = redis_client.get(key)
     assert value is not None, f"Redis键不存在: {key}"
     
@@ -60,3 +154,52 @@ def assert_redis_key_exists(redis_client, key, expected_value=None):
         assert value == expected_value, \
             f"Redis值不匹配，键: {key}, 预期: {expected_value}, 实际: {value}"
     return value
+
+def assert_redis_keys_exist(redis_client, expected, timeout=None, name="redis_keys"):
+    """批量断言Redis键存在（一次MGET），expected为键列表或 {键: 预期值}，指定timeout时重试等待"""
+    if timeout is not None:
+        return eventually(lambda: assert_redis_keys_exist(redis_client, expected), timeout, name)
+    keys = list(expected)
+    values = redis_client.get_many(keys)
+    missing = [key for key in keys if values[key] is None]
+    assert not missing, f"Redis键不存在: {missing}"
+
+    if isinstance(expected, dict):
+        mismatched = {
+            key: {"预期": value, "实际": values[key]}
+            for key, value in expected.items() if value is not None and values[key] != value
+        }
+        assert not mismatched, f"Redis值不匹配: {mismatched}"
+    return values
+
+def assert_mq_message_received(mq_client, queue_name, predicate=None, correlation_id=None, routing_key=None,
+                               timeout=10, name="mq_message"):
+    """断言在超时时间内收到匹配的MQ消息（消息到达即返回），返回ReceivedMessage"""
+    start = time.monotonic()
+    try:
+        message = mq_client.await_message(queue_name, predicate, correlation_id, routing_key, timeout)
+    except TimeoutError as e:
+        consistency_metrics.record(name, time.monotonic() - start, 1, False)
+        raise AssertionError(f"未收到MQ消息，队列: {queue_name}，{str(e)}")
+    consistency_metrics.record(name, time.monotonic() - start, 1, True)
+    return message
+
+def assert_response_time(source, phase="total", **budget):
+    """断言响应时间在预算内（毫秒），超出时抛出LatencyBudgetExceeded
+
+    source可以是接口对象（取最近一次请求）、BaseAPI记录的耗时字典，或它们的列表（按百分位汇总）
+    例：assert_response_time(user_api, max=500)；assert_response_time(timings, p95=200, max=800)
+    """
+    sources = source if isinstance(source, (list, tuple)) else [source]
+    histogram = LatencyHistogram()
+    for item in sources:
+        timings = item if isinstance(item, dict) else item.last_timing
+        assert timings is not None, "没有可用的请求耗时记录"
+        histogram.record(timings[phase])
+
+    violations = check_latency_budget(histogram, budget)
+    if violations:
+        message = f"延迟预算超出（{phase}，样本数={histogram.count}）: {'，'.join(violations)}"
+        logger.error(message)
+        raise LatencyBudgetExceeded(message)
+    return histogram.summary((50, 90, 95, 99))
@@ -0,0 +1,159 @@
+import glob
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import threading
+from urllib.parse import urlencode
+from utils.log_utils import logger, WORKER_ID
+
+# HTTP模式：passthrough=直接请求，record=请求并录制，replay=从录制数据回放（不发起请求）
+HTTP_MODES = ("passthrough", "record", "replay")
+
+INDEX_PREFIX = "index"
+BODY_PREFIX = "bodies"
+
+
+class CassetteMissError(LookupError):
+    """回放模式下找不到对应的录制数据"""
+
+
+def request_key(method, url, params=None, json_body=None, data=None):
+    """请求的索引键：方法 + 完整URL（含排序后的查询参数）+ 归一化请求体（加密前的明文）的哈希"""
+    if params:
+        url = f"{url}?{urlencode(sorted(dict(params).items()), doseq=True)}"
+    if json_body is not None:
+        body = json.dumps(json_body, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    elif isinstance(data, dict):
+        body = urlencode(sorted(data.items()), doseq=True).encode("utf-8")
+    elif isinstance(data, str):
+        body = data.encode("utf-8")
+    else:
+        body = data or b""
+    digest = hashlib.sha1(f"{method.upper()} {url}\n".encode("utf-8"))
+    digest.update(body)
+    return digest.hexdigest()
+
+
+class Cassette:
+    """录制/回放存储
+
+    录制：响应数据追加写入 bodies*.bin，索引（键、偏移、长度）追加写入 index*.jsonl，xdist下每个worker各自一组文件
+    回放：启动时只加载索引到字典（按键O(1)查找），响应数据通过mmap按需读取解析；
+    同一请求录制了多次时按录制顺序依次回放，回放完后重复最后一次
+    """
+
+    def __init__(self, mode, directory):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"不支持的录制模式: {mode}")
+        self.mode = mode
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._index = {}      # 键 -> [(数据文件, 偏移, 长度), ...]
+        self._cursors = {}    # 键 -> 下一次回放的序号
+        self._maps = {}       # 数据文件 -> mmap
+        self._files = []
+        self._body_file = None
+        self._index_file = None
+        self._offset = 0
+        if mode == "replay":
+            self._load_index()
+        else:
+            self._open_for_record()
+
+    def _open_for_record(self):
+        os.makedirs(self.directory, exist_ok=True)
+        suffix = f"_{WORKER_ID}" if WORKER_ID else ""
+        self._body_name = f"{BODY_PREFIX}{suffix}.bin"
+        self._body_file = open(os.path.join(self.directory, self._body_name), "ab")
+        self._index_file = open(os.path.join(self.directory, f"{INDEX_PREFIX}{suffix}.jsonl"), "a", encoding="utf-8")
+        self._offset = self._body_file.tell()
+
+    def _load_index(self):
+        paths = sorted(glob.glob(os.path.join(self.directory, f"{INDEX_PREFIX}*.jsonl")))
+        if not paths:
+            raise FileNotFoundError(f"录制数据不存在，请先以 --http-mode=record 执行: {self.directory}")
+        for path in paths:
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._index.setdefault(entry["key"], []).append(
+                            (entry["file"], entry["offset"], entry["length"])
+                        )
+        logger.info(f"已加载录制索引: {self.directory}，共 {len(self._index)} 个请求")
+
+    def _map(self, file_name):
+        mapped = self._maps.get(file_name)
+        if mapped is None:
+            f = open(os.path.join(self.directory, file_name), "rb")
+            self._files.append(f)
+            mapped = self._maps[file_name] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return mapped
+
+    def record(self, key, method, url, status, result=None, error=None, headers=None, body=None):
+        """追加一条录制数据；HTTP错误时result为空，记录错误信息及原始响应头、响应体"""
+        body = json.dumps({"status": status, "result": result, "error": error, "headers": headers, "body": body},
+                          ensure_ascii=False).encode("utf-8")
+        with self._lock:
+            self._body_file.write(body)
+            self._index_file.write(json.dumps({
+                "key": key, "method": method, "url": url, "status": status,
+                "file": self._body_name, "offset": self._offset, "length": len(body)
+            }, ensure_ascii=False) + "\n")
+            self._offset += len(body)
+
+    def replay(self, key, method, url):
+        """返回录制的 {"status", "result", "error", "headers", "body"}，不存在时抛出CassetteMissError"""
+        entries = self._index.get(key)
+        if not entries:
+            raise CassetteMissError(f"没有找到录制数据: {method} {url}（键: {key}）")
+        with self._lock:
+            position = self._cursors.get(key, 0)
+            self._cursors[key] = position + 1
+            file_name, offset, length = entries[min(position, len(entries) - 1)]
+            body = self._map(file_name)[offset:offset + length]
+        return json.loads(body)
+
+    def close(self):
+        with self._lock:
+            for f in (self._body_file, self._index_file):
+                if f:
+                    f.close()
+            self._body_file = self._index_file = None
+            for mapped in self._maps.values():
+                mapped.close()
+            for f in self._files:
+                f.close()
+            self._maps.clear()
+            self._files.clear()
+
+
+# 当前进程使用的录制存储，passthrough模式下为None
+_cassette = None
+
+
+def get_cassette():
+    return _cassette
+
+
+def use_cassette(mode, directory, clear=False):
+    """设置HTTP模式；record模式下clear=True时先清空旧的录制数据（xdist下仅由主进程清空）"""
+    global _cassette
+    close_cassette()
+    if mode not in HTTP_MODES:
+        raise ValueError(f"不支持的HTTP模式: {mode}，可选: {HTTP_MODES}")
+    if mode == "record" and clear and os.path.isdir(directory):
+        shutil.rmtree(directory)
+    if mode != "passthrough":
+        _cassette = Cassette(mode, directory)
+        logger.info(f"HTTP模式: {mode}，录制目录: {directory}")
+    return _cassette
+
+
+def close_cassette():
+    global _cassette
+    if _cassette is not None:
+        _cassette.close()
+        _cassette = None
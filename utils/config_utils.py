@@ -1,22 +1,106 @@
 import yaml
+import json
 import os
+import threading
 from pathlib import Path
 from utils.log_utils import logger
 
 # 项目根目录
 PROJECT_ROOT = Path(__file__).parent.parent.resolve()
 
+# 优先使用C实现的YAML解析器
+YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+class ReadOnlyDict(dict):
+    """只读字典，配置在进程内共享，禁止原地修改（需要修改时先copy()）"""
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("配置为只读，请先copy()后再修改")
+
+    __setitem__ = __delitem__ = __ior__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+    def __reduce__(self):
+        return ReadOnlyDict, (dict(self),)
+
+    def __deepcopy__(self, memo):
+        return _thaw(self)
+
+
+class ReadOnlyList(list):
+    """只读列表"""
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("配置为只读，请先copy()后再修改")
+
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _readonly
+    append = extend = insert = pop = remove = clear = sort = reverse = _readonly
+
+    def __reduce__(self):
+        return ReadOnlyList, (list(self),)
+
+    def __deepcopy__(self, memo):
+        return _thaw(self)
+
+
+def _freeze(data):
+    if isinstance(data, dict):
+        return ReadOnlyDict((key, _freeze(value)) for key, value in data.items())
+    if isinstance(data, list):
+        return ReadOnlyList(_freeze(item) for item in data)
+    return data
+
+
+def _thaw(data):
+    if isinstance(data, dict):
+        return {key: _thaw(value) for key, value in data.items()}
+    if isinstance(data, list):
+        return [_thaw(item) for item in data]
+    return data
+
+
+# 配置缓存：文件路径 -> (修改时间, 只读配置)，文件修改后自动重新解析
+_config_cache = {}
+_config_cache_lock = threading.Lock()
+
+
 def _load_yaml_config(file_path):
-    """加载YAML配置文件"""
-    if not os.path.exists(file_path):
-        raise FileNotFoundError(f"配置文件不存在: {file_path}")
-    
+    """加载YAML配置文件（进程内缓存，文件修改时间变化时重新解析）"""
     try:
-        with open(file_path, "r", encoding="utf-8") as f:
-            return yaml.safe_load(f)
-    except yaml.YAMLError as e:
-        logger.error(f"配置文件解析错误: {file_path}, 错误: {str(e)}")
-        raise
+        mtime = os.stat(file_path).st_mtime_ns
+    except FileNotFoundError:
+        raise FileNotFoundError(f"配置文件不存在: {file_path}")
+
+    cached = _config_cache.get(file_path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    with _config_cache_lock:
+        cached = _config_cache.get(file_path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+
+        try:
+            with open(file_path, "r", encoding="utf-8") as f:
+                if str(file_path).endswith(".json"):
+                    data = json.load(f)
+                else:
+                    data = yaml.load(f, Loader=YamlLoader)
+        except (yaml.YAMLError, ValueError) as e:
+            logger.error(f"配置文件解析错误: {file_path}, 错误: {str(e)}")
+            raise
+
+        config = _freeze(data)
+        _config_cache[file_path] = (mtime, config)
+        return config
+
+
+def clear_config_cache():
+    """清空配置缓存"""
+    with _config_cache_lock:
+        _config_cache.clear()
+
 
 def load_env_config(env_name):
     """加载环境基础配置"""
@@ -26,8 +110,7 @@ def load_env_config(env_name):
     if env_name not in all_config:
         raise ValueError(f"环境配置不存在: {env_name}")
     
-    config = all_config[env_name]
-    config["env"] = env_name
+    config = ReadOnlyDict(all_config[env_name], env=env_name)
     logger.info(f"加载环境配置: {env_name}")
     return config
 
@@ -64,6 +147,17 @@ def load_mq_config(env_name):
     logger.info(f"加载MQ配置: {env_name}")
     return all_config[env_name]
 
+def load_perf_config(env_name):
+    """加载压测配置"""
+    config_path = os.path.join(PROJECT_ROOT, "config", "perf_config.yaml")
+    all_config = _load_yaml_config(config_path)
+    
+    if env_name not in all_config:
+        raise ValueError(f"压测配置不存在: {env_name}")
+    
+    logger.info(f"加载压测配置: {env_name}")
+    return all_config[env_name]
+
 def load_schema(schema_name):
     """加载JSON Schema验证文件"""
     schema_path = os.path.join(PROJECT_ROOT, "config", "schemas", f"{schema_name}.json")
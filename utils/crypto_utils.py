@@ -7,11 +7,164 @@ from Crypto.Util.Padding import pad, unpad
 from Crypto.Signature import pkcs1_15
 from Crypto.Hash import SHA256
 import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+from itertools import chain, islice
 from dotenv import load_dotenv
-from utils.log_utils import logger
+from utils.log_utils import logger, detach_file_logging
 
 load_dotenv()
 
+class KeyRing:
+    """密钥环：密钥只解析一次，按密钥缓存RSA加解密器和签名器"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._env_keys = {}
+        self._aes_keys = {}
+        self._rsa_keys = {}
+        self._oaep_ciphers = {}
+        self._signers = {}
+
+    def env_key(self, name):
+        """读取环境变量中的默认密钥（只读取一次，调用reload()重新读取）"""
+        if name not in self._env_keys:
+            self._env_keys[name] = os.getenv(name)
+        return self._env_keys[name]
+
+    def aes_key(self, key=None):
+        """获取校验后的AES密钥字节"""
+        key = key or self.env_key("AES_SECRET_KEY")
+        if not key:
+            raise ValueError("AES密钥未配置")
+
+        key_bytes = self._aes_keys.get(key)
+        if key_bytes is None:
+            key_bytes = key.encode('utf-8')
+            if len(key_bytes) not in [16, 24, 32]:
+                raise ValueError("AES密钥长度必须为16、24或32字节")
+            self._aes_keys[key] = key_bytes
+        return key_bytes
+
+    def rsa_key(self, pem):
+        """解析RSA密钥（RSA.import_key开销大，按PEM缓存）"""
+        key = self._rsa_keys.get(pem)
+        if key is None:
+            with self._lock:
+                key = self._rsa_keys.get(pem)
+                if key is None:
+                    key = RSA.import_key(pem)
+                    self._rsa_keys[pem] = key
+        return key
+
+    def public_key(self, public_key=None):
+        public_key = public_key or self.env_key("RSA_PUBLIC_KEY")
+        if not public_key:
+            raise ValueError("RSA公钥未配置")
+        return public_key
+
+    def private_key(self, private_key=None):
+        private_key = private_key or self.env_key("RSA_PRIVATE_KEY")
+        if not private_key:
+            raise ValueError("RSA私钥未配置")
+        return private_key
+
+    def oaep_cipher(self, pem):
+        """获取RSA OAEP加解密器"""
+        cipher = self._oaep_ciphers.get(pem)
+        if cipher is None:
+            cipher = PKCS1_OAEP.new(self.rsa_key(pem))
+            self._oaep_ciphers[pem] = cipher
+        return cipher
+
+    def signer(self, pem):
+        """获取PKCS#1 v1.5签名/验签器"""
+        signer = self._signers.get(pem)
+        if signer is None:
+            signer = pkcs1_15.new(self.rsa_key(pem))
+            self._signers[pem] = signer
+        return signer
+
+    def reload(self):
+        """清空缓存，下次使用时重新读取环境变量并解析密钥"""
+        with self._lock:
+            self._env_keys.clear()
+            self._aes_keys.clear()
+            self._rsa_keys.clear()
+            self._oaep_ciphers.clear()
+            self._signers.clear()
+
+
+# 全局密钥环
+keyring = KeyRing()
+
+# 批量接口：批量数据不足该条数时在当前进程内直接执行，避免进程池启动开销
+BATCH_PARALLEL_THRESHOLD = 2000
+BATCH_CHUNK_SIZE = 500
+
+# 进程池worker内的密钥（初始化时传入一次）
+_worker_keys = {}
+
+
+def _init_crypto_worker(keys):
+    """进程池worker初始化：加载密钥并预解析，后续每个分块复用"""
+    detach_file_logging()
+    _worker_keys.update(keys)
+    for name, key in keys.items():
+        if key and name in ("private_key", "public_key"):
+            keyring.rsa_key(key)
+
+
+def _crypto_chunk(operation, chunk):
+    """在worker内处理一个分块"""
+    return _run_operation(operation, chunk, _worker_keys)
+
+
+def _run_operation(operation, items, keys):
+    if operation == "sign":
+        return [CryptoUtils.sign(text, keys["private_key"]) for text in items]
+    if operation == "verify_sign":
+        return [CryptoUtils.verify_sign(text, signature, keys["public_key"]) for text, signature in items]
+    if operation == "aes_encrypt":
+        return [CryptoUtils.aes_encrypt(text, keys["aes_key"]) for text in items]
+    if operation == "aes_decrypt":
+        return [CryptoUtils.aes_decrypt(text, keys["aes_key"]) for text in items]
+    raise ValueError(f"不支持的批量操作: {operation}")
+
+
+def _chunked(iterator, size):
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _run_batch(operation, items, keys, workers=None, chunk_size=BATCH_CHUNK_SIZE,
+               threshold=BATCH_PARALLEL_THRESHOLD):
+    """分块批量执行并按输入顺序逐个返回结果；数据量小于threshold时不启用进程池"""
+    iterator = iter(items)
+    head = list(islice(iterator, threshold))
+    if len(head) < threshold:
+        yield from _run_operation(operation, head, keys)
+        return
+
+    workers = workers or os.cpu_count() or 1
+    logger.info(f"批量加解密启用进程池: 操作={operation}, 进程数={workers}, 分块大小={chunk_size}")
+    chunks = _chunked(chain(head, iterator), chunk_size)
+    # 按窗口提交分块，结果按顺序流式返回，内存中最多保留 2*workers 个分块
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_crypto_worker, initargs=(keys,)) as executor:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(_crypto_chunk, operation, chunk))
+            if len(pending) >= workers * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
 class CryptoUtils:
     @staticmethod
     def md5_encrypt(text):
@@ -25,14 +178,8 @@ class CryptoUtils:
     @staticmethod
     def aes_encrypt(text, key=None):
         """AES加密（CBC模式）"""
-        key = key or os.getenv("AES_SECRET_KEY")
-        if not key:
-            raise ValueError("AES密钥未配置")
-            
-        key = key.encode('utf-8')
-        if len(key) not in [16, 24, 32]:
-            raise ValueError("AES密钥长度必须为16、24或32字节")
-            
+        key = keyring.aes_key(key)
+
         if not isinstance(text, str):
             text = str(text)
         text = text.encode('utf-8')
@@ -50,11 +197,7 @@ class CryptoUtils:
     @staticmethod
     def aes_decrypt(encrypted_text, key=None):
         """AES解密（CBC模式）"""
-        key = key or os.getenv("AES_SECRET_KEY")
-        if not key:
-            raise ValueError("AES密钥未配置")
-            
-        key = key.encode('utf-8')
+        key = keyring.aes_key(key)
         try:
             # 解码Base64
             data = base64.b64decode(encrypted_text)
@@ -74,31 +217,23 @@ class CryptoUtils:
     @staticmethod
     def rsa_encrypt(text, public_key=None):
         """RSA加密"""
-        public_key = public_key or os.getenv("RSA_PUBLIC_KEY")
-        if not public_key:
-            raise ValueError("RSA公钥未配置")
-            
+        public_key = keyring.public_key(public_key)
+
         if not isinstance(text, str):
             text = str(text)
         text = text.encode('utf-8')
         
-        key = RSA.import_key(public_key)
-        cipher = PKCS1_OAEP.new(key)
-        encrypted = cipher.encrypt(text)
+        encrypted = keyring.oaep_cipher(public_key).encrypt(text)
         return base64.b64encode(encrypted).decode('utf-8')
 
     @staticmethod
     def rsa_decrypt(encrypted_text, private_key=None):
         """RSA解密"""
-        private_key = private_key or os.getenv("RSA_PRIVATE_KEY")
-        if not private_key:
-            raise ValueError("RSA私钥未配置")
-            
+        private_key = keyring.private_key(private_key)
+
         try:
             encrypted = base64.b64decode(encrypted_text)
-            key = RSA.import_key(private_key)
-            cipher = PKCS1_OAEP.new(key)
-            return cipher.decrypt(encrypted).decode('utf-8')
+            return keyring.oaep_cipher(private_key).decrypt(encrypted).decode('utf-8')
         except Exception as e:
             logger.error(f"RSA解密失败: {str(e)}")
             raise
@@ -106,38 +241,60 @@ class CryptoUtils:
     @staticmethod
     def sign(text, private_key=None):
         """生成RSA签名（SHA256）"""
-        private_key = private_key or os.getenv("RSA_PRIVATE_KEY")
-        if not private_key:
-            raise ValueError("RSA私钥未配置")
-            
+        private_key = keyring.private_key(private_key)
+
         if not isinstance(text, str):
             text = str(text)
-            
-        key = RSA.import_key(private_key)
+
         hash_obj = SHA256.new(text.encode('utf-8'))
-        signer = pkcs1_15.new(key)
-        signature = signer.sign(hash_obj)
+        signature = keyring.signer(private_key).sign(hash_obj)
         return base64.b64encode(signature).decode('utf-8')
 
     @staticmethod
     def verify_sign(text, signature, public_key=None):
         """验证RSA签名"""
-        public_key = public_key or os.getenv("RSA_PUBLIC_KEY")
+        public_key = public_key or keyring.env_key("RSA_PUBLIC_KEY")
         if not public_key or not signature:
             return False
-            
+
         if not isinstance(text, str):
             text = str(text)
-            
+
         try:
-            key = RSA.import_key(public_key)
             hash_obj = SHA256.new(text.encode('utf-8'))
-            verifier = pkcs1_15.new(key)
-            verifier.verify(hash_obj, base64.b64decode(signature))
+            keyring.signer(public_key).verify(hash_obj, base64.b64decode(signature))
             return True
         except (ValueError, TypeError, Exception) as e:
             logger.warning(f"签名验证失败: {str(e)}")
             return False
 
-    def get_timestamp(self):
-        pass
+    @staticmethod
+    def sign_many(texts, private_key=None, workers=None, chunk_size=BATCH_CHUNK_SIZE):
+        """批量生成RSA签名，按输入顺序逐个返回（生成器）"""
+        keys = {"private_key": keyring.private_key(private_key)}
+        return _run_batch("sign", texts, keys, workers, chunk_size)
+
+    @staticmethod
+    def verify_many(pairs, public_key=None, workers=None, chunk_size=BATCH_CHUNK_SIZE):
+        """批量验证RSA签名，pairs为 (原文, 签名) 序列，按输入顺序逐个返回结果（生成器）"""
+        keys = {"public_key": keyring.public_key(public_key)}
+        return _run_batch("verify_sign", pairs, keys, workers, chunk_size)
+
+    @staticmethod
+    def aes_encrypt_many(texts, key=None, workers=None, chunk_size=BATCH_CHUNK_SIZE):
+        """批量AES加密，按输入顺序逐个返回（生成器）"""
+        keyring.aes_key(key)
+        keys = {"aes_key": key or keyring.env_key("AES_SECRET_KEY")}
+        return _run_batch("aes_encrypt", texts, keys, workers, chunk_size)
+
+    @staticmethod
+    def aes_decrypt_many(encrypted_texts, key=None, workers=None, chunk_size=BATCH_CHUNK_SIZE):
+        """批量AES解密，按输入顺序逐个返回（生成器）"""
+        keyring.aes_key(key)
+        keys = {"aes_key": key or keyring.env_key("AES_SECRET_KEY")}
+        return _run_batch("aes_decrypt", encrypted_texts, keys, workers, chunk_size)
+
+    @staticmethod
+    def get_timestamp():
+        """获取毫秒级时间戳"""
+        return int(time.time() * 1000)
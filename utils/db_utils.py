@@ -1,52 +1,279 @@
 import pymysql
-from pymysql.cursors import DictCursor
+from pymysql.cursors import DictCursor, SSDictCursor
 from contextlib import contextmanager
+from collections import deque
 import os
+import threading
+import time
+import uuid
 from dotenv import load_dotenv
-from utils.log_utils import logger
+from utils.log_utils import logger, WORKER_ID
 
 load_dotenv()
 
+# 默认连接池配置，可在 config/db_config.yaml 的 pool 节点中覆盖
+DEFAULT_POOL_CONFIG = {
+    "min_size": 1,                # 最少保留的连接数
+    "max_size": 10,               # 最大连接数
+    "idle_timeout": 300,          # 空闲超过该秒数的连接被回收（保留min_size个）
+    "health_check_interval": 30,  # 空闲超过该秒数的连接在取出时先ping检查
+    "acquire_timeout": 10         # 连接耗尽时等待的秒数
+}
+
+
+class MySQLConnectionPool:
+    """线程安全的MySQL连接池：取出时健康检查，空闲连接超时回收"""
+
+    def __init__(self, config, pool_config=None):
+        self.config = config
+        self.pool_config = {**DEFAULT_POOL_CONFIG, **(pool_config or {})}
+        self._idle = deque()  # (连接, 归还时间)，后进先出，优先复用最近使用的连接
+        self._size = 0
+        self._condition = threading.Condition()
+        self._closed = False
+
+    def _create_connection(self):
+        connection = pymysql.connect(
+            host=self.config["host"],
+            port=self.config["port"],
+            user=self.config["user"],
+            password=os.getenv(self.config["password_key"]),
+            database=self.config["database"],
+            charset=self.config.get("charset", "utf8mb4"),
+            cursorclass=DictCursor
+        )
+        logger.info(f"数据库连接成功: {self.config['host']}:{self.config['port']}/{self.config['database']}")
+        return connection
+
+    def _is_healthy(self, connection, idle_seconds):
+        if not connection.open:
+            return False
+        if idle_seconds < self.pool_config["health_check_interval"]:
+            return True
+        try:
+            connection.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, connection):
+        """关闭连接并释放名额（调用方需持有锁）"""
+        self._size -= 1
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def _evict_idle(self):
+        """回收空闲超时的连接（调用方需持有锁）"""
+        now = time.monotonic()
+        idle_timeout = self.pool_config["idle_timeout"]
+        while self._idle and self._size > self.pool_config["min_size"]:
+            connection, released_at = self._idle[0]
+            if now - released_at < idle_timeout:
+                break
+            self._idle.popleft()
+            self._discard(connection)
+            logger.debug("回收空闲数据库连接")
+
+    def fill(self):
+        """预建min_size个连接"""
+        with self._condition:
+            while self._size < self.pool_config["min_size"]:
+                self._size += 1
+                try:
+                    connection = self._create_connection()
+                except Exception:
+                    self._size -= 1
+                    raise
+                self._idle.append((connection, time.monotonic()))
+
+    def acquire(self):
+        """取出一个可用连接，连接耗尽时等待，超时抛出异常"""
+        deadline = time.monotonic() + self.pool_config["acquire_timeout"]
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise RuntimeError("数据库连接池已关闭")
+                self._evict_idle()
+
+                while self._idle:
+                    connection, released_at = self._idle.pop()
+                    if self._is_healthy(connection, time.monotonic() - released_at):
+                        return connection
+                    logger.warning("数据库连接已失效，丢弃并重建")
+                    self._discard(connection)
+
+                if self._size < self.pool_config["max_size"]:
+                    self._size += 1
+                    break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"获取数据库连接超时，连接池已满: {self.pool_config['max_size']}")
+                self._condition.wait(remaining)
+
+        # 在锁外建立连接，避免阻塞其他线程归还/取出
+        try:
+            return self._create_connection()
+        except Exception as e:
+            with self._condition:
+                self._size -= 1
+                self._condition.notify()
+            logger.error(f"数据库连接失败: {str(e)}")
+            raise
+
+    def release(self, connection):
+        """归还连接，非自动提交模式下总是回滚（避免脏数据和一致性读快照被下一个使用者沿用）
+
+        不能依据server_status判断是否在事务中：pymysql不会用SELECT结果集结束时的EOF包更新该状态
+        """
+        healthy = connection.open
+        if healthy and not connection.autocommit_mode:
+            try:
+                connection.rollback()
+            except Exception:
+                healthy = False
+
+        with self._condition:
+            if self._closed or not healthy:
+                self._discard(connection)
+            else:
+                self._idle.append((connection, time.monotonic()))
+            self._condition.notify()
+
+    @contextmanager
+    def connection(self):
+        """连接上下文管理器"""
+        connection = self.acquire()
+        try:
+            yield connection
+        finally:
+            self.release(connection)
+
+    def stats(self):
+        """连接池状态"""
+        with self._condition:
+            return {"size": self._size, "idle": len(self._idle), "in_use": self._size - len(self._idle)}
+
+    def close(self):
+        """关闭所有空闲连接，使用中的连接归还时关闭"""
+        with self._condition:
+            self._closed = True
+            while self._idle:
+                connection, _ = self._idle.pop()
+                self._discard(connection)
+            self._condition.notify_all()
+
+
+def quote_identifier(identifier):
+    """转义表名/列名"""
+    return "`" + str(identifier).replace("`", "``") + "`"
+
+
+# MySQL表名最大长度
+MAX_IDENTIFIER_LENGTH = 64
+
+
+def new_backup_token():
+    """备份表令牌：xdist worker + 随机串，并发worker、多次执行之间的备份表互不覆盖"""
+    return f"{WORKER_ID or 'master'}_{uuid.uuid4().hex[:8]}"
+
+
+def backup_table_name(table, tag, token):
+    """备份表名，如 t_user__seed_gw0_1a2b3c4d，超长时截断原表名部分"""
+    suffix = f"__{tag}_{token}"
+    return f"{table[:MAX_IDENTIFIER_LENGTH - len(suffix)]}{suffix}"
+
+
 class MySQLClient:
     def __init__(self, config):
         self.config = config
-        self.connection = None
+        self.pool = MySQLConnectionPool(config, config.get("pool"))
+        self._pinned = None  # 测试隔离期间固定使用的连接
+        self._pinned_lock = threading.RLock()
+        self._savepoint_id = 0
 
     def connect(self):
-        """建立数据库连接"""
-        if self.connection and self.connection.open:
-            return self.connection
-
+        """建立数据库连接（预建连接池最小连接数）"""
         try:
-            self.connection = pymysql.connect(
-                host=self.config["host"],
-                port=self.config["port"],
-                user=self.config["user"],
-                password=os.getenv(self.config["password_key"]),
-                database=self.config["database"],
-                charset=self.config.get("charset", "utf8mb4"),
-                cursorclass=DictCursor
-            )
-            logger.info(f"数据库连接成功: {self.config['host']}:{self.config['port']}/{self.config['database']}")
-            return self.connection
+            self.pool.fill()
+            return self.pool
         except Exception as e:
             logger.error(f"数据库连接失败: {str(e)}")
             raise
 
+    @contextmanager
+    def _connection(self):
+        """取得连接：测试隔离期间使用固定连接（加锁串行使用），否则从连接池取出"""
+        if self._pinned is not None:
+            with self._pinned_lock:
+                yield self._pinned
+        else:
+            with self.pool.connection() as connection:
+                yield connection
+
+    @contextmanager
+    def isolated(self):
+        """测试隔离：固定一个连接并开启事务，期间所有操作共用该连接，退出时整体回滚
+
+        隔离期间 commit=True 的操作以保存点代替提交；DDL、TRUNCATE 会隐式提交，无法回滚
+        """
+        connection = self.pool.acquire()
+        try:
+            connection.begin()
+            self._pinned = connection
+            logger.debug("数据库测试隔离已开启")
+            yield connection
+        finally:
+            self._pinned = None
+            try:
+                connection.rollback()
+                logger.debug("数据库测试隔离结束，已回滚")
+            finally:
+                self.pool.release(connection)
+
     @contextmanager
     def get_cursor(self, commit=False):
-        """数据库游标上下文管理器"""
-        self.connect()
-        cursor = self.connection.cursor()
-        
+        """数据库游标上下文管理器（从连接池取出连接，线程间互不影响）"""
+        with self._connection() as connection:
+            if connection is self._pinned:
+                with self._savepoint_cursor(connection, commit) as cursor:
+                    yield cursor
+                return
+
+            cursor = connection.cursor()
+
+            try:
+                yield cursor
+                if commit:
+                    connection.commit()
+                    logger.debug("数据库事务已提交")
+            except Exception as e:
+                connection.rollback()
+                logger.error(f"数据库操作失败，已回滚: {str(e)}")
+                raise
+            finally:
+                cursor.close()
+
+    @contextmanager
+    def _savepoint_cursor(self, connection, commit):
+        """测试隔离期间的游标：需要提交的操作包在保存点中，失败时只回滚到保存点"""
+        cursor = connection.cursor()
+        savepoint = None
+        if commit:
+            self._savepoint_id += 1
+            savepoint = f"sp_{self._savepoint_id}"
+            cursor.execute(f"SAVEPOINT {savepoint}")
+
         try:
             yield cursor
-            if commit:
-                self.connection.commit()
-                logger.debug("数据库事务已提交")
+            if savepoint:
+                cursor.execute(f"RELEASE SAVEPOINT {savepoint}")
         except Exception as e:
-            self.connection.rollback()
-            logger.error(f"数据库操作失败，已回滚: {str(e)}")
+            if savepoint:
+                cursor.execute(f"ROLLBACK TO SAVEPOINT {savepoint}")
+            logger.error(f"数据库操作失败，已回滚到保存点: {str(e)}")
             raise
         finally:
             cursor.close()
@@ -68,11 +295,102 @@ class MySQLClient:
             logger.debug(f"影响行数: {cursor.rowcount}")
             return cursor.rowcount
 
+    def stream_query(self, sql, params=None, chunk_size=1000):
+        """流式查询：使用服务端游标逐块读取，每次返回不超过chunk_size行的列表（生成器）
+
+        适用于大表校验，内存中只保留当前块；迭代结束或生成器关闭前会占用一个连接
+        """
+        logger.debug(f"流式查询SQL: {sql}, 参数: {params}, 分块大小: {chunk_size}")
+        total = 0
+        with self._connection() as connection:
+            cursor = connection.cursor(SSDictCursor)
+            try:
+                cursor.execute(sql, params or ())
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    total += len(rows)
+                    yield rows
+            finally:
+                # 未读完时关闭游标会丢弃剩余结果，连接可继续复用
+                cursor.close()
+        logger.debug(f"流式查询结束: 共 {total} 条记录")
+
+    def iter_rows(self, sql, params=None, chunk_size=1000):
+        """流式逐行查询（生成器）"""
+        for rows in self.stream_query(sql, params, chunk_size):
+            yield from rows
+
     def close(self):
         """关闭数据库连接"""
-        if self.connection and self.connection.open:
-            self.connection.close()
-            logger.info("数据库连接已关闭")
+        self.pool.close()
+        logger.info("数据库连接已关闭")
+
+class TableSnapshot:
+    """基于表校验和的快照还原：表首次登记时在服务端备份，用例结束后仅对校验和变化的表还原"""
+
+    def __init__(self, db_client):
+        self.db_client = db_client
+        self._checksums = {}  # 表名 -> 备份时的校验和
+        self._backup_token = new_backup_token()
+
+    def _backup_name(self, table):
+        return backup_table_name(table, "snapshot", self._backup_token)
+
+    def _checksum(self, cursor, tables):
+        cursor.execute(f"CHECKSUM TABLE {', '.join(quote_identifier(t) for t in tables)}")
+        return {row["Table"].split(".")[-1]: row["Checksum"] for row in cursor.fetchall()}
+
+    def track(self, tables):
+        """登记需要保护的表，未备份过的表创建备份并记录校验和"""
+        new_tables = [table for table in tables if table not in self._checksums]
+        if not new_tables:
+            return
+
+        with self.db_client.get_cursor(commit=True) as cursor:
+            for table in new_tables:
+                backup = quote_identifier(self._backup_name(table))
+                cursor.execute(f"DROP TABLE IF EXISTS {backup}")
+                cursor.execute(f"CREATE TABLE {backup} LIKE {quote_identifier(table)}")
+                cursor.execute(f"INSERT INTO {backup} SELECT * FROM {quote_identifier(table)}")
+                logger.info(f"已创建表快照: {table}")
+            self._checksums.update(self._checksum(cursor, new_tables))
+
+    def restore_changed(self, tables=None):
+        """对校验和发生变化的表从快照还原，返回被还原的表"""
+        tables = [table for table in (tables or self._checksums) if table in self._checksums]
+        if not tables:
+            return []
+
+        with self.db_client.get_cursor(commit=True) as cursor:
+            current = self._checksum(cursor, tables)
+            changed = [table for table in tables if current.get(table) != self._checksums[table]]
+            if not changed:
+                return []
+
+            cursor.execute("SET FOREIGN_KEY_CHECKS = 0")
+            try:
+                for table in changed:
+                    cursor.execute(f"DELETE FROM {quote_identifier(table)}")
+                    cursor.execute(
+                        f"INSERT INTO {quote_identifier(table)} "
+                        f"SELECT * FROM {quote_identifier(self._backup_name(table))}"
+                    )
+                    logger.info(f"表数据已变化，已从快照还原: {table}")
+            finally:
+                cursor.execute("SET FOREIGN_KEY_CHECKS = 1")
+        return changed
+
+    def drop(self):
+        """删除所有快照备份表"""
+        if not self._checksums:
+            return
+        with self.db_client.get_cursor(commit=True) as cursor:
+            for table in self._checksums:
+                cursor.execute(f"DROP TABLE IF EXISTS {quote_identifier(self._backup_name(table))}")
+        self._checksums.clear()
+
 
 def get_db_client(env="test"):
     """快捷获取数据库客户端"""
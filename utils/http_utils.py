@@ -0,0 +1,154 @@
+import threading
+import requests
+from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+from utils.log_utils import logger
+
+# 默认连接池配置，可在 config/env.yaml 的 pool 节点中覆盖
+DEFAULT_POOL_CONFIG = {
+    "pool_connections": 10,   # 缓存的主机连接池数量
+    "pool_maxsize": 20,       # 单个主机的最大连接数
+    "pool_block": False,      # 连接耗尽时是否阻塞等待
+    "keep_alive": True,       # 是否复用长连接
+    "max_retries": 0,         # 连接级重试次数
+    "backoff_factor": 0.3     # 重试退避系数
+}
+
+
+class PoolStats:
+    """按主机统计新建连接数与请求数"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hosts = {}
+
+    def _host_stats(self, host):
+        return self._hosts.setdefault(host, {"opened": 0, "requests": 0})
+
+    def record_open(self, host):
+        with self._lock:
+            self._host_stats(host)["opened"] += 1
+
+    def record_request(self, host):
+        with self._lock:
+            self._host_stats(host)["requests"] += 1
+
+    def snapshot(self):
+        """返回统计快照：opened=新建连接数，reused=复用连接的请求数"""
+        with self._lock:
+            return {
+                host: {
+                    "opened": s["opened"],
+                    "requests": s["requests"],
+                    "reused": max(s["requests"] - s["opened"], 0)
+                }
+                for host, s in self._hosts.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            self._hosts.clear()
+
+
+def _counting_pool_class(base, stats):
+    """生成记录实际建连次数（TCP/TLS握手）的连接池类"""
+    class CountingConnection(base.ConnectionCls):
+        def connect(self):
+            stats.record_open(f"{self.host}:{self.port}")
+            return super().connect()
+
+    class CountingConnectionPool(base):
+        ConnectionCls = CountingConnection
+
+    return CountingConnectionPool
+
+
+class InstrumentedHTTPAdapter(HTTPAdapter):
+    """可配置连接池大小、阻塞策略和重试，并统计连接复用情况的适配器"""
+
+    def __init__(self, stats, pool_connections, pool_maxsize, pool_block, max_retries):
+        self.stats = stats
+        super().__init__(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            pool_block=pool_block,
+            max_retries=max_retries
+        )
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _counting_pool_class(HTTPConnectionPool, self.stats),
+            "https": _counting_pool_class(HTTPSConnectionPool, self.stats)
+        }
+
+    def send(self, request, **kwargs):
+        parsed = urlparse(request.url)
+        port = parsed.port or (443 if parsed.scheme == "https" else 80)
+        self.stats.record_request(f"{parsed.hostname}:{port}")
+        return super().send(request, **kwargs)
+
+
+# 当前进程（xdist worker）内共享的适配器（连接池），按连接池配置区分
+_adapters = {}
+_adapters_lock = threading.Lock()
+pool_stats = PoolStats()
+
+
+def _merge_pool_config(pool_config):
+    config = dict(DEFAULT_POOL_CONFIG)
+    config.update(pool_config or {})
+    return config
+
+
+def get_adapter(pool_config=None):
+    """获取当前进程共享的适配器，相同配置的接口类复用同一组连接池"""
+    config = _merge_pool_config(pool_config)
+    key = tuple(sorted(config.items()))
+    with _adapters_lock:
+        adapter = _adapters.get(key)
+        if adapter is None:
+            adapter = InstrumentedHTTPAdapter(
+                stats=pool_stats,
+                pool_connections=config["pool_connections"],
+                pool_maxsize=config["pool_maxsize"],
+                pool_block=config["pool_block"],
+                # read=False与requests默认一致：读超时不重试，直接抛出ReadTimeout（避免GET重复执行并放大超时时间）
+                max_retries=Retry(
+                    total=config["max_retries"],
+                    read=False,
+                    backoff_factor=config["backoff_factor"],
+                    raise_on_status=False
+                )
+            )
+            _adapters[key] = adapter
+            logger.debug(f"创建共享HTTP连接池: {config}")
+        return adapter
+
+
+def create_session(pool_config=None):
+    """创建挂载共享连接池的会话（Cookie等会话状态各自独立，连接跨会话复用）"""
+    config = _merge_pool_config(pool_config)
+    adapter = get_adapter(config)
+
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    if not config["keep_alive"]:
+        session.headers["Connection"] = "close"
+    return session
+
+
+def get_pool_stats():
+    """获取连接池统计信息"""
+    return pool_stats.snapshot()
+
+
+def close_pools():
+    """关闭所有共享连接池"""
+    with _adapters_lock:
+        for adapter in _adapters.values():
+            adapter.close()
+        _adapters.clear()
@@ -1,21 +1,164 @@
 import logging
+import logging.handlers
+import atexit
+import glob
+import heapq
+import json
 import os
+import queue
+import threading
+import time
+import uuid
+from collections import deque
 from pathlib import Path
 from pythonjsonlogger import jsonlogger
 from datetime import datetime
+from dotenv import load_dotenv
+
+load_dotenv()
 
 # 日志目录
 LOG_DIR = os.path.join(Path(__file__).parent.parent.resolve(), "reports", "logs")
 os.makedirs(LOG_DIR, exist_ok=True)
 
-# 日志文件名（包含日期）
-LOG_FILE = os.path.join(LOG_DIR, f"test_{datetime.now().strftime('%Y%m%d')}.log")
+# 日志文件名（包含日期），xdist并行时每个worker写独立文件，会话结束后合并
+LOG_DATE = datetime.now().strftime('%Y%m%d')
+MAIN_LOG_FILE = os.path.join(LOG_DIR, f"test_{LOG_DATE}.log")
+WORKER_ID = os.getenv("PYTEST_XDIST_WORKER")
+LOG_FILE = os.path.join(LOG_DIR, f"test_{LOG_DATE}_{WORKER_ID}.log") if WORKER_ID else MAIN_LOG_FILE
+
+# 日志文件轮转与批量写入配置
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", 100 * 1024 * 1024))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", 10))
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", 200))
+
+# 日志采集模式：all=DEBUG日志全部落盘；failure=DEBUG日志先进入用例级环形缓冲，仅用例失败时落盘
+LOG_CAPTURE_MODE = os.getenv("LOG_CAPTURE_MODE", "all").lower()
+LOG_BUFFER_SIZE = int(os.getenv("LOG_BUFFER_SIZE", 5000))
+
+# 文件日志级别，设为INFO及以上时接口请求/响应的DEBUG日志不再构建
+LOG_LEVEL = os.getenv("LOG_LEVEL", "DEBUG").upper()
+
+# 默认脱敏键路径，"."分隔层级，"*"匹配任意键或列表下标
+DEFAULT_MASK_PATHS = ["password", "*.password", "token", "*.token", "Authorization"]
+MASK = "***"
+
+_json_encoder = json.JSONEncoder(ensure_ascii=False)
+
+
+class BatchedRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """按大小或跨天轮转的文件处理器，记录攒批后再刷盘"""
+
+    def __init__(self, filename, max_bytes, backup_count, batch_size):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+        self.batch_size = batch_size
+        self.pending = 0
+        self.next_rollover = self._compute_next_rollover()
+
+    @staticmethod
+    def _compute_next_rollover():
+        tomorrow = datetime.now().date().toordinal() + 1
+        return time.mktime(datetime.fromordinal(tomorrow).timetuple())
+
+    def shouldRollover(self, record):
+        # 只比较已写入大小，避免基类为计算长度而重复格式化记录
+        if self.stream is None:
+            return False
+        return self.stream.tell() >= self.maxBytes > 0 or record.created >= self.next_rollover
+
+    def doRollover(self):
+        super().doRollover()
+        self.pending = 0
+        self.next_rollover = self._compute_next_rollover()
+
+    def emit(self, record):
+        try:
+            if self.shouldRollover(record):
+                self.doRollover()
+            if self.stream is None:
+                self.stream = self._open()
+            self.stream.write(self.format(record) + self.terminator)
+            self.pending += 1
+            if self.pending >= self.batch_size:
+                self.flush()
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        super().flush()
+        self.pending = 0
+
+
+class BatchingQueueListener(logging.handlers.QueueListener):
+    """后台日志线程：队列排空时才刷盘，高负载下自然合并为批量写入"""
+
+    def dequeue(self, block):
+        try:
+            return self.queue.get_nowait()
+        except queue.Empty:
+            for handler in self.handlers:
+                handler.flush()
+            return self.queue.get(block)
+
+
+class CaseLogBuffer(logging.Filter):
+    """为日志记录注入用例ID；失败采集模式下拦截用例执行期间的DEBUG记录，存入有界环形缓冲"""
+
+    def __init__(self, capacity, enabled):
+        super().__init__()
+        self.enabled = enabled
+        self.records = deque(maxlen=capacity)
+        self.case_id = None
+        self.capturing = False
+
+    def filter(self, record):
+        record.case_id = self.case_id
+        if self.capturing and record.levelno < logging.INFO:
+            self.records.append(record)
+            return False
+        return True
+
+    def start(self, case_id):
+        self.case_id = case_id
+        self.records.clear()
+        self.capturing = self.enabled
+
+    def stop(self):
+        self.case_id = None
+        self.capturing = False
+
+    def drain(self):
+        records = list(self.records)
+        self.records.clear()
+        return records
+
+
+class SamplingFilter(logging.Filter):
+    """采样模式：当前线程的请求未被采样时丢弃WARNING以下的日志（压测时降低日志开销）"""
+
+    def __init__(self):
+        super().__init__()
+        self.local = threading.local()
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or getattr(self.local, "sampled", True)
+
+
+log_queue = queue.Queue(-1)
+log_listener = None
+file_handler = None
+queue_handler = None
+case_buffer = CaseLogBuffer(LOG_BUFFER_SIZE, LOG_CAPTURE_MODE == "failure")
+sampling_filter = SamplingFilter()
 
 
 def setup_logger():
-    """配置日志系统"""
+    """配置日志系统：控制台同步输出，文件日志经队列由后台线程格式化并写入"""
+    global log_listener, file_handler, queue_handler
     logger = logging.getLogger()
-    logger.setLevel(logging.DEBUG)
+    file_level = getattr(logging, LOG_LEVEL, logging.DEBUG)
+    # 根日志级别取各处理器的最低级别，使 isEnabledFor 能准确判断是否需要构建日志
+    logger.setLevel(min(logging.INFO, file_level))
 
     # 避免重复添加处理器
     if logger.handlers:
@@ -28,28 +171,185 @@ def setup_logger():
         '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
     )
     console_handler.setFormatter(console_formatter)
+    console_handler.addFilter(sampling_filter)
 
-    # 文件处理器（JSON格式）
-    file_handler = logging.FileHandler(LOG_FILE, encoding='utf-8')
-    file_handler.setLevel(logging.DEBUG)
+    # 文件处理器（JSON格式），在后台线程中执行
+    file_handler = BatchedRotatingFileHandler(LOG_FILE, LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_BATCH_SIZE)
+    file_handler.setLevel(file_level)
     json_formatter = jsonlogger.JsonFormatter(
-        '%(asctime)s %(name)s %(levelname)s %(message)s %(module)s %(funcName)s'
+        '%(asctime)s %(name)s %(levelname)s %(message)s %(module)s %(funcName)s %(case_id)s'
     )
     file_handler.setFormatter(json_formatter)
 
+    # 队列处理器：用例线程只负责入队
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.setLevel(file_level)
+    queue_handler.addFilter(sampling_filter)
+    queue_handler.addFilter(case_buffer)
+    log_listener = BatchingQueueListener(log_queue, file_handler, respect_handler_level=True)
+    log_listener.start()
+    atexit.register(stop_log_listener)
+
     # 添加处理器
     logger.addHandler(console_handler)
-    logger.addHandler(file_handler)
+    logger.addHandler(queue_handler)
 
     return logger
 
 
-def set_case_context(self, context):
-    return None
+def flush_logs():
+    """等待队列中的日志全部写入并刷盘"""
+    if log_listener is None:
+        return
+    log_queue.join()
+    file_handler.flush()
+
+
+def stop_log_listener():
+    """停止后台日志线程并关闭文件"""
+    global log_listener
+    if log_listener is None:
+        return
+    log_listener.stop()
+    log_listener = None
+    file_handler.close()
+
+
+def detach_file_logging():
+    """子进程（如进程池worker）中移除队列处理器，后台写日志线程不随fork复制，避免向无人消费的队列写入"""
+    if queue_handler is not None:
+        logging.getLogger().removeHandler(queue_handler)
+
+
+def _worker_log_files(worker_log):
+    """worker日志文件及其轮转备份，按时间先后排列"""
+    backups = sorted(
+        glob.glob(f"{worker_log}.*"),
+        key=lambda path: int(path.rsplit(".", 1)[1]),
+        reverse=True
+    )
+    return backups + [worker_log]
+
+
+def _read_lines(paths):
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            yield from f
+
+
+def merge_worker_logs():
+    """将各worker日志按时间顺序流式合并到主日志文件，合并后删除worker日志
+
+    JSON日志每行以asctime开头，按行前缀比较即为时间顺序
+    """
+    worker_logs = sorted(glob.glob(os.path.join(LOG_DIR, f"test_{LOG_DATE}_gw*.log")))
+    if not worker_logs:
+        return
+
+    streams = [_read_lines(_worker_log_files(path)) for path in worker_logs]
+    flush_logs()
+    handler = file_handler
+    if handler:
+        handler.acquire()
+    try:
+        with open(MAIN_LOG_FILE, "a", encoding="utf-8") as f:
+            f.writelines(heapq.merge(*streams, key=lambda line: line[:40]))
+    finally:
+        if handler:
+            handler.release()
+
+    for path in worker_logs:
+        for log_file in _worker_log_files(path):
+            os.remove(log_file)
+
+
+def _mask(data, paths):
+    wildcard = any(path[0] == "*" for path in paths)
+    if isinstance(data, dict):
+        keys = data.keys() if wildcard else [path[0] for path in paths if path[0] in data]
+    elif isinstance(data, list):
+        keys = range(len(data)) if wildcard else [
+            int(path[0]) for path in paths if path[0].isdigit() and int(path[0]) < len(data)
+        ]
+    else:
+        return data
+
+    result = None
+    for key in keys:
+        sub_paths = [path[1:] for path in paths if path[0] in ("*", str(key))]
+        if not sub_paths:
+            continue
+        value = data[key]
+        new_value = MASK if any(not path for path in sub_paths) else _mask(value, sub_paths)
+        if new_value is not value:
+            if result is None:
+                result = dict(data) if isinstance(data, dict) else list(data)
+            result[key] = new_value
+    return data if result is None else result
+
+
+def mask_sensitive_data(data, mask_paths=None):
+    """按键路径脱敏敏感数据，只复制被修改的层级，原数据不变"""
+    paths = [path.split(".") for path in (mask_paths or DEFAULT_MASK_PATHS)]
+    return _mask(data, paths)
+
+
+def truncate_json(data, max_length=2000, size_hint=None):
+    """序列化为JSON并截断，超长时边序列化边截断，不生成完整字符串
+
+    size_hint为已知的原始字节数，不超过max_length时直接整体序列化（重新序列化会加入分隔符空格，仍需截断）
+    """
+    if size_hint is not None and size_hint <= max_length:
+        text = _json_encoder.encode(data)
+        return text if len(text) <= max_length else text[:max_length] + "...(已截断)"
+
+    chunks = []
+    length = 0
+    for chunk in _json_encoder.iterencode(data):
+        chunks.append(chunk)
+        length += len(chunk)
+        if length > max_length:
+            return "".join(chunks)[:max_length] + "...(已截断)"
+    return "".join(chunks)
+
+
+def set_log_sampled(sampled):
+    """设置当前线程后续日志是否被采样记录"""
+    sampling_filter.local.sampled = sampled
+
+
+def is_log_sampled():
+    """当前线程的日志是否被采样（未设置时默认记录）"""
+    return getattr(sampling_filter.local, "sampled", True)
+
+
+def set_case_context(case_name):
+    """设置当前用例上下文，返回用例ID"""
+    case_id = f"{case_name}-{uuid.uuid4().hex[:8]}"
+    case_buffer.start(case_id)
+    return case_id
 
 
 def clear_case_context():
-    return None
+    """清除用例上下文（缓冲保留到下一个用例开始，供teardown阶段失败时输出）"""
+    case_buffer.stop()
+
+
+_buffer_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+
+def dump_case_logs():
+    """用例失败时调用：将缓冲的DEBUG日志写入日志文件，并返回文本供报告附加"""
+    records = case_buffer.drain()
+    if not records:
+        return ""
+
+    lines = []
+    for record in records:
+        lines.append(_buffer_formatter.format(record))
+        if queue_handler is not None:
+            log_queue.put_nowait(queue_handler.prepare(record))
+    return "\n".join(lines)
 
 
 # 全局日志对象
@@ -0,0 +1,365 @@
+import glob
+import json
+import math
+import os
+import re
+import threading
+import time
+from functools import lru_cache
+from urllib.parse import urlsplit
+from utils.log_utils import LOG_DIR, WORKER_ID
+
+# 直方图最小可分辨延迟（秒）与相邻分桶的比例（相对误差约1%）
+HISTOGRAM_MIN_VALUE = 1e-6
+HISTOGRAM_BUCKET_RATIO = 1.02
+_LOG_RATIO = math.log(HISTOGRAM_BUCKET_RATIO)
+
+# 接口耗时统计导出目录
+METRICS_DIR = os.path.join(os.path.dirname(LOG_DIR), "metrics")
+METRICS_FILE_NAME = f"request_metrics_{WORKER_ID}" if WORKER_ID else "request_metrics"
+
+# 请求耗时阶段：total=总耗时，http=网络请求（含服务端处理），ttfb=首字节时间，
+# serialize=JSON序列化/解析，encrypt/decrypt=加解密，log=日志构建，framework=总耗时中除网络请求外的框架开销
+REQUEST_PHASES = ("total", "http", "ttfb", "serialize", "encrypt", "decrypt", "log", "framework")
+
+# 延迟预算可设置的统计项（毫秒）
+BUDGET_KEYS = ("avg", "p50", "p90", "p95", "p99", "max")
+
+_ID_SEGMENT = re.compile(r"^(\d+|[0-9a-fA-F]{16,}|[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12})$")
+
+
+class LatencyHistogram:
+    """对数分桶的延迟直方图：内存占用与样本数无关，百分位相对误差约1%，可合并
+
+    记录单位为秒，summary() 输出毫秒
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.buckets = {}  # 分桶下标 -> 次数
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    @staticmethod
+    def _bucket(value):
+        if value <= HISTOGRAM_MIN_VALUE:
+            return 0
+        return int(math.log(value / HISTOGRAM_MIN_VALUE) / _LOG_RATIO) + 1
+
+    def record(self, value):
+        bucket = self._bucket(value)
+        with self._lock:
+            self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+            self.count += 1
+            self.total += value
+            if value > self.max:
+                self.max = value
+
+    def merge(self, other):
+        with other._lock:
+            buckets, count, total, maximum = dict(other.buckets), other.count, other.total, other.max
+        with self._lock:
+            for bucket, n in buckets.items():
+                self.buckets[bucket] = self.buckets.get(bucket, 0) + n
+            self.count += count
+            self.total += total
+            self.max = max(self.max, maximum)
+        return self
+
+    def percentile(self, percent):
+        """返回百分位延迟（秒），取所在分桶的上界，不超过最大值"""
+        with self._lock:
+            if not self.count:
+                return 0.0
+            rank = max(1, math.ceil(self.count * percent / 100))
+            seen = 0
+            for bucket in sorted(self.buckets):
+                seen += self.buckets[bucket]
+                if seen >= rank:
+                    return min(HISTOGRAM_MIN_VALUE * HISTOGRAM_BUCKET_RATIO ** bucket, self.max)
+            return self.max
+
+    def summary(self, percentiles=(50, 90, 99)):
+        """汇总：次数、平均值、各百分位和最大值（毫秒）"""
+        result = {"count": self.count, "avg": round(self.total / self.count * 1000, 3) if self.count else 0.0}
+        for percent in percentiles:
+            result[f"p{percent}"] = round(self.percentile(percent) * 1000, 3)
+        result["max"] = round(self.max * 1000, 3)
+        return result
+
+    def to_dict(self):
+        with self._lock:
+            return {"buckets": dict(self.buckets), "count": self.count, "total": self.total, "max": self.max}
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls()
+        histogram.buckets = {int(bucket): n for bucket, n in data["buckets"].items()}
+        histogram.count = data["count"]
+        histogram.total = data["total"]
+        histogram.max = data["max"]
+        return histogram
+
+
+@lru_cache(maxsize=4096)
+def endpoint_template(url):
+    """将请求路径归一化为接口模板，如 /api/v1/user/123 -> /api/v1/user/{id}（去掉域名和查询参数）"""
+    path = urlsplit(url).path or "/"
+    return "/".join("{id}" if _ID_SEGMENT.match(segment) else segment for segment in path.split("/"))
+
+
+class RequestTimer:
+    """单次请求的分阶段计时（同一阶段可多次计时并累加），用法: with timer.phase("encrypt"): ..."""
+
+    __slots__ = ("started", "phases", "_name", "_start")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}
+        self._name = None
+        self._start = 0.0
+
+    def phase(self, name):
+        self._name = name
+        return self
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.phases[self._name] = self.phases.get(self._name, 0.0) + time.perf_counter() - self._start
+
+    def finish(self, ttfb=None):
+        """结束计时，返回各阶段耗时（秒）"""
+        timings = dict(self.phases)
+        timings["total"] = time.perf_counter() - self.started
+        timings["framework"] = timings["total"] - timings.get("http", 0.0)
+        if ttfb is not None:
+            timings["ttfb"] = ttfb
+        return timings
+
+
+class RequestMetrics:
+    """按 "方法 接口模板" 聚合各阶段耗时直方图和响应状态计数"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.endpoints = {}  # (方法, 接口模板) -> {"phases": {阶段: 直方图}, "status": {状态: 次数}}
+        self._listeners = []
+
+    def add_listener(self, listener):
+        """注册监听器，每次记录时调用 listener(method, endpoint, timings, status)"""
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def _entry(self, key):
+        entry = self.endpoints.get(key)
+        if entry is None:
+            with self._lock:
+                entry = self.endpoints.setdefault(key, {"phases": {}, "status": {}})
+        return entry
+
+    def record(self, method, endpoint, timings, status):
+        entry = self._entry((method, endpoint))
+        status = str(status)
+        with self._lock:
+            entry["status"][status] = entry["status"].get(status, 0) + 1
+            histograms = [entry["phases"].setdefault(phase, LatencyHistogram()) for phase in timings]
+        for histogram, value in zip(histograms, timings.values()):
+            histogram.record(value)
+        for listener in self._listeners:
+            listener(method, endpoint, timings, status)
+
+    def summary(self):
+        """各接口各阶段的耗时统计（毫秒）"""
+        with self._lock:
+            items = list(self.endpoints.items())
+        return {
+            f"{method} {endpoint}": {
+                "status": dict(entry["status"]),
+                "phases": {phase: entry["phases"][phase].summary((50, 90, 99))
+                           for phase in REQUEST_PHASES if phase in entry["phases"]}
+            }
+            for (method, endpoint), entry in sorted(items)
+        }
+
+    def to_dict(self):
+        """可合并的完整数据（含直方图分桶）"""
+        with self._lock:
+            items = list(self.endpoints.items())
+        return [
+            {"method": method, "endpoint": endpoint,
+             "status": dict(entry["status"]),
+             "phases": {phase: histogram.to_dict() for phase, histogram in entry["phases"].items()}}
+            for (method, endpoint), entry in items
+        ]
+
+    def merge_dict(self, data):
+        for item in data:
+            entry = self._entry((item["method"], item["endpoint"]))
+            with self._lock:
+                for status, count in item["status"].items():
+                    entry["status"][status] = entry["status"].get(status, 0) + count
+                histograms = [
+                    (entry["phases"].setdefault(phase, LatencyHistogram()), LatencyHistogram.from_dict(value))
+                    for phase, value in item["phases"].items()
+                ]
+            for histogram, other in histograms:
+                histogram.merge(other)
+
+    def format_table(self):
+        """终端汇总表：请求数、非2xx数，总耗时百分位，网络请求与框架开销中位数（毫秒）"""
+        summary = self.summary()
+        if not summary:
+            return []
+        width = max(len(name) for name in summary) + 2
+        lines = [
+            f"{'接口':<{width}}{'请求数':>8}{'失败':>6}{'p50':>10}{'p90':>10}{'p99':>10}{'max':>10}"
+            f"{'http p50':>10}{'框架 p50':>10}"
+        ]
+        for name, item in summary.items():
+            total = item["phases"]["total"]
+            failed = sum(count for status, count in item["status"].items() if not status.startswith("2"))
+            lines.append(
+                f"{name:<{width}}{total['count']:>8}{failed:>6}{total['p50']:>10}{total['p90']:>10}"
+                f"{total['p99']:>10}{total['max']:>10}"
+                f"{item['phases'].get('http', {}).get('p50', 0):>10}{item['phases']['framework']['p50']:>10}"
+            )
+        return lines
+
+    def to_prometheus(self):
+        """导出Prometheus文本格式（summary类型，单位秒）"""
+        lines = [
+            "# HELP api_request_duration_seconds API request duration by phase",
+            "# TYPE api_request_duration_seconds summary"
+        ]
+        with self._lock:
+            items = sorted(self.endpoints.items())
+        for (method, endpoint), entry in items:
+            for phase in REQUEST_PHASES:
+                histogram = entry["phases"].get(phase)
+                if histogram is None:
+                    continue
+                labels = f'method="{method}",endpoint="{endpoint}",phase="{phase}"'
+                for quantile in (0.5, 0.9, 0.99):
+                    lines.append(
+                        f'api_request_duration_seconds{{{labels},quantile="{quantile}"}} '
+                        f'{histogram.percentile(quantile * 100):.6f}'
+                    )
+                lines.append(f"api_request_duration_seconds_sum{{{labels}}} {histogram.total:.6f}")
+                lines.append(f"api_request_duration_seconds_count{{{labels}}} {histogram.count}")
+        lines.append("# HELP api_requests_total API requests by response status")
+        lines.append("# TYPE api_requests_total counter")
+        for (method, endpoint), entry in items:
+            for status, count in sorted(entry["status"].items()):
+                lines.append(f'api_requests_total{{method="{method}",endpoint="{endpoint}",status="{status}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    def export(self, directory=METRICS_DIR, name=METRICS_FILE_NAME):
+        """导出JSON（含可合并的直方图数据）和Prometheus文本文件，返回文件路径"""
+        os.makedirs(directory, exist_ok=True)
+        json_path = os.path.join(directory, f"{name}.json")
+        prom_path = os.path.join(directory, f"{name}.prom")
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump({"summary": self.summary(), "raw": self.to_dict()}, f, ensure_ascii=False, indent=2)
+        with open(prom_path, "w", encoding="utf-8") as f:
+            f.write(self.to_prometheus())
+        return json_path, prom_path
+
+    def merge_worker_exports(self, directory=METRICS_DIR):
+        """合并各xdist worker导出的统计并删除worker文件"""
+        for path in sorted(glob.glob(os.path.join(directory, "request_metrics_gw*.json"))):
+            with open(path, "r", encoding="utf-8") as f:
+                self.merge_dict(json.load(f)["raw"])
+            os.remove(path)
+            prom_path = path[:-len(".json")] + ".prom"
+            if os.path.exists(prom_path):
+                os.remove(prom_path)
+
+    def clear(self):
+        with self._lock:
+            self.endpoints.clear()
+
+
+# 全局接口耗时统计（进程内）
+request_metrics = RequestMetrics()
+
+
+class LatencyBudgetExceeded(AssertionError):
+    """响应时间超出延迟预算（与功能断言失败分开统计和展示）"""
+
+
+def check_latency_budget(histogram, budget):
+    """按预算（毫秒，键为BUDGET_KEYS中的统计项）检查直方图，返回超出项描述列表"""
+    unknown = set(budget) - set(BUDGET_KEYS)
+    if unknown:
+        raise ValueError(f"不支持的延迟预算项: {sorted(unknown)}，可选: {BUDGET_KEYS}")
+    summary = histogram.summary((50, 90, 95, 99))
+    return [
+        f"{key}={summary[key]}ms > {limit}ms"
+        for key, limit in budget.items() if limit is not None and summary[key] > limit
+    ]
+
+
+class LatencyBudgetTracker:
+    """按用例分组（参数化用例的各实例为一组）累计请求耗时，用于整组的百分位预算检查
+
+    样本按用例nodeid保存，失败重跑（--reruns）时替换该用例上一次的样本，不重复计入
+    """
+
+    def __init__(self):
+        self.groups = {}  # 分组 -> {"budget": 预算, "items": {nodeid: 直方图}, "checked": 是否已检查}
+
+    def _entry(self, group, budget):
+        return self.groups.setdefault(group, {"budget": budget, "items": {}, "checked": False})
+
+    def add(self, group, budget, histogram, nodeid):
+        """记录用例的耗时样本（替换该用例之前的样本），返回分组"""
+        entry = self._entry(group, budget)
+        entry["items"][nodeid] = histogram
+        return entry
+
+    def discard(self, group, nodeid):
+        """丢弃用例的样本（如重跑后功能失败）"""
+        entry = self.groups.get(group)
+        if entry is not None:
+            entry["items"].pop(nodeid, None)
+
+    @staticmethod
+    def histogram(entry):
+        """分组内所有用例样本合并后的直方图"""
+        merged = LatencyHistogram()
+        for histogram in entry["items"].values():
+            merged.merge(histogram)
+        return merged
+
+    def evaluate(self, include_checked=False):
+        """检查分组（默认跳过已在用例中检查过的分组），返回 {分组: (超出项列表, 统计摘要)}（仅包含超出预算的分组）"""
+        result = {}
+        for group, entry in self.groups.items():
+            if (entry["checked"] and not include_checked) or not entry["items"]:
+                continue
+            histogram = self.histogram(entry)
+            violations = check_latency_budget(histogram, entry["budget"])
+            if violations:
+                result[group] = (violations, histogram.summary((50, 90, 95, 99)))
+        return result
+
+    def to_dict(self):
+        return {
+            group: {"budget": entry["budget"], "checked": entry["checked"],
+                    "items": {nodeid: histogram.to_dict() for nodeid, histogram in entry["items"].items()}}
+            for group, entry in self.groups.items()
+        }
+
+    def merge_dict(self, data):
+        for group, item in data.items():
+            entry = self._entry(group, item["budget"])
+            for nodeid, histogram in item["items"].items():
+                entry["items"][nodeid] = LatencyHistogram.from_dict(histogram)
+            entry["checked"] = entry["checked"] or item["checked"]
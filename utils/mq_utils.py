@@ -1,6 +1,9 @@
 import pika
 import os
 import json
+import queue
+import threading
+from collections import OrderedDict, namedtuple
 from threading import Thread
 import time
 from dotenv import load_dotenv
@@ -8,12 +11,497 @@ from utils.log_utils import logger
 
 load_dotenv()
 
+# 批量发布时默认的未确认消息窗口大小
+DEFAULT_CONFIRM_WINDOW = 1000
+
+# 消费者池默认配置，可在 config/mq_config.yaml 的 consumer 节点中覆盖
+DEFAULT_CONSUMER_CONFIG = {
+    "consumers": 1,          # 消费者数量（每个消费者独立连接/通道）
+    "workers": 4,            # 处理消息的工作线程数
+    "prefetch_count": 200,   # 每个消费者未确认消息上限（basic_qos）
+    "queue_size": 1000,      # 消费者与工作线程之间的缓冲队列大小，满时阻塞消费者形成背压
+    "ack_batch_size": 100,   # 累计多少条已处理消息后批量确认
+    "ack_interval": 0.2      # 最长多久（秒）确认一次
+}
+
+# await_message 消息索引默认容量（超出后淘汰最早收到的消息）
+DEFAULT_INDEX_CAPACITY = 10000
+
+# 消费到的消息：消息体（已解析）、路由键、correlation_id、原始属性、接收时间
+ReceivedMessage = namedtuple("ReceivedMessage", "body routing_key correlation_id properties received_at")
+
+
+def _serialize_message(message):
+    """序列化消息，返回 (消息体, content_type)（需在序列化前判断类型）"""
+    if isinstance(message, (dict, list)):
+        return json.dumps(message), "application/json"
+    if not isinstance(message, (str, bytes)):
+        message = str(message)
+    return message, "text/plain"
+
+
+def _decode_body(body):
+    """解析消息体：优先JSON，否则按文本返回"""
+    try:
+        return json.loads(body)
+    except (ValueError, TypeError):
+        return body.decode('utf-8') if isinstance(body, bytes) else body
+
+
+def _percentile(sorted_values, percent):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * percent / 100))
+    return sorted_values[index]
+
+
+class _ConfirmPublisher:
+    """基于SelectConnection的批量发布：开启发布确认，未确认消息不超过window条，
+    收到确认（可能为multiple批量确认）后继续发送，而不是逐条同步等待确认
+    """
+
+    def __init__(self, messages, exchange, routing_key, window):
+        self.messages = iter(messages)
+        self.exchange = exchange
+        self.routing_key = routing_key
+        self.window = window
+        self.connection = None
+        self.channel = None
+        self.error = None
+        self.finished = False
+        self._exhausted = False
+        self._next_tag = 1
+        self._pending = OrderedDict()  # delivery_tag -> 发送时间
+        self.published = 0
+        self.acked = 0
+        self.nacked = 0
+        self.latencies = []
+
+    def run(self, parameters, timeout):
+        self.connection = pika.SelectConnection(
+            parameters,
+            on_open_callback=self._on_connection_open,
+            on_open_error_callback=self._on_connection_open_error,
+            on_close_callback=self._on_connection_closed
+        )
+        self.connection.ioloop.call_later(timeout, self._on_timeout)
+        self.connection.ioloop.start()
+        if self.error is not None:
+            raise self.error if isinstance(self.error, Exception) else pika.exceptions.AMQPError(self.error)
+
+    def _on_connection_open(self, connection):
+        connection.channel(on_open_callback=self._on_channel_open)
+
+    def _on_connection_open_error(self, connection, error):
+        self.error = error
+        connection.ioloop.stop()
+
+    def _on_connection_closed(self, connection, reason):
+        if not self.finished and self.error is None:
+            self.error = reason
+        connection.ioloop.stop()
+
+    def _on_channel_open(self, channel):
+        self.channel = channel
+        channel.add_on_close_callback(self._on_channel_closed)
+        channel.confirm_delivery(self._on_confirm, callback=lambda frame: self._publish_window())
+
+    def _on_channel_closed(self, channel, reason):
+        if not self.finished and self.error is None:
+            self.error = reason
+        self._close()
+
+    def _on_timeout(self):
+        if not self.finished:
+            self.error = TimeoutError(f"MQ批量发送超时: 已发送={self.published}, 未确认={len(self._pending)}")
+            self._close()
+
+    def _publish_window(self):
+        """补足窗口内的未确认消息"""
+        while not self._exhausted and len(self._pending) < self.window:
+            try:
+                message = next(self.messages)
+            except StopIteration:
+                self._exhausted = True
+                break
+            body, content_type = _serialize_message(message)
+            self.channel.basic_publish(
+                exchange=self.exchange,
+                routing_key=self.routing_key,
+                body=body,
+                properties=pika.BasicProperties(delivery_mode=2, content_type=content_type)
+            )
+            self._pending[self._next_tag] = time.monotonic()
+            self._next_tag += 1
+            self.published += 1
+
+        if self._exhausted and not self._pending:
+            self.finished = True
+            self._close()
+
+    def _on_confirm(self, frame):
+        method = frame.method
+        acked = isinstance(method, pika.spec.Basic.Ack)
+        now = time.monotonic()
+        if method.multiple:
+            tags = []
+            for tag in self._pending:
+                if tag > method.delivery_tag:
+                    break
+                tags.append(tag)
+        else:
+            tags = [method.delivery_tag] if method.delivery_tag in self._pending else []
+
+        for tag in tags:
+            self.latencies.append(now - self._pending.pop(tag))
+        if acked:
+            self.acked += len(tags)
+        else:
+            self.nacked += len(tags)
+        self._publish_window()
+
+    def _close(self):
+        if self.connection and not (self.connection.is_closing or self.connection.is_closed):
+            self.connection.close()
+
+    def stats(self, elapsed):
+        latencies = sorted(self.latencies)
+        return {
+            "published": self.published,
+            "acked": self.acked,
+            "nacked": self.nacked,
+            "elapsed": round(elapsed, 3),
+            "rate": round(self.published / elapsed, 1) if elapsed > 0 else 0.0,
+            "confirm_latency_avg": round(sum(latencies) / len(latencies), 6) if latencies else 0.0,
+            "confirm_latency_p50": round(_percentile(latencies, 50), 6),
+            "confirm_latency_p99": round(_percentile(latencies, 99), 6),
+            "confirm_latency_max": round(latencies[-1], 6) if latencies else 0.0
+        }
+
+
+class _AckTracker:
+    """记录单个通道上已处理的消息，按连续的delivery_tag批量确认（basic_ack multiple=True）
+
+    工作线程只登记结果，确认操作由通道所属的消费者线程执行（pika通道不能跨线程使用）
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._settled = set()
+        self._failed = []
+        self._nacked = set()  # 已nack但尚未被连续区间覆盖的delivery_tag
+        self._acked_upto = 0  # 已确认的最大连续delivery_tag
+
+    def settle(self, delivery_tag, success):
+        with self._lock:
+            self._settled.add(delivery_tag)
+            if not success:
+                self._failed.append(delivery_tag)
+
+    def pending(self):
+        with self._lock:
+            return len(self._settled)
+
+    def flush(self, channel):
+        """在消费者线程中执行：先逐条nack失败的消息，再批量ack连续区间，返回ack条数"""
+        with self._lock:
+            failed, self._failed = self._failed, []
+            start = upto = self._acked_upto
+            while upto + 1 in self._settled:
+                upto += 1
+                self._settled.discard(upto)
+            self._acked_upto = upto
+            # 失败的消息可能位于空缺之后，要等连续区间覆盖到它时才从ack条数中扣除
+            self._nacked.update(failed)
+            nacked_in_range = {tag for tag in self._nacked if tag <= upto}
+            self._nacked -= nacked_in_range
+
+        for tag in failed:
+            channel.basic_nack(delivery_tag=tag, requeue=False)
+        # 对已nack的delivery_tag再ack会导致 406 PRECONDITION_FAILED 并关闭通道，
+        # 批量ack只到区间内最后一条未被nack的消息；multiple=True 不影响其之前已nack的消息
+        ack_upto = upto
+        while ack_upto > start and ack_upto in nacked_in_range:
+            ack_upto -= 1
+        if ack_upto > start:
+            channel.basic_ack(delivery_tag=ack_upto, multiple=True)
+        return upto - start - len(nacked_in_range)
+
+
+class _Waiter:
+    def __init__(self, correlation_id, routing_key, predicate, claim):
+        self.correlation_id = correlation_id
+        self.routing_key = routing_key
+        self.predicate = predicate
+        self.claim = claim
+        self.event = threading.Event()
+        self.result = None
+        self.error = None  # 匹配条件最近一次抛出的异常
+
+    def matches(self, message):
+        """匹配条件抛出异常时视为不匹配，不影响消息入索引和其他等待者"""
+        if self.correlation_id is not None and message.correlation_id != self.correlation_id:
+            return False
+        if self.routing_key is not None and message.routing_key != self.routing_key:
+            return False
+        if self.predicate is None:
+            return True
+        try:
+            return bool(self.predicate(message.body))
+        except Exception as e:
+            if self.error is None:
+                logger.warning(f"MQ消息匹配条件执行异常，视为不匹配: {type(e).__name__}: {str(e)}")
+            self.error = e
+            return False
+
+
+class MessageIndex:
+    """有界消息索引：按correlation_id、路由键建立索引，新消息到达时直接唤醒匹配的等待者
+
+    消息先到、等待后到时从索引中查找；claim=True时匹配到的消息被取走，不会再被其他等待匹配
+    """
+
+    def __init__(self, capacity=DEFAULT_INDEX_CAPACITY):
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._messages = OrderedDict()  # 序号 -> 消息，按接收顺序
+        self._by_correlation = {}       # correlation_id -> {序号: None}
+        self._by_routing_key = {}       # 路由键 -> {序号: None}
+        self._waiters = []
+
+    def _index(self, seq, message):
+        self._messages[seq] = message
+        if message.correlation_id is not None:
+            self._by_correlation.setdefault(message.correlation_id, {})[seq] = None
+        self._by_routing_key.setdefault(message.routing_key, {})[seq] = None
+
+    def _remove(self, seq):
+        message = self._messages.pop(seq)
+        for index, key in ((self._by_correlation, message.correlation_id), (self._by_routing_key, message.routing_key)):
+            seqs = index.get(key)
+            if seqs is not None:
+                seqs.pop(seq, None)
+                if not seqs:
+                    del index[key]
+        return message
+
+    def _find(self, waiter):
+        if waiter.correlation_id is not None:
+            candidates = list(self._by_correlation.get(waiter.correlation_id, ()))
+        elif waiter.routing_key is not None:
+            candidates = list(self._by_routing_key.get(waiter.routing_key, ()))
+        else:
+            candidates = list(self._messages)
+        for seq in candidates:
+            message = self._messages[seq]
+            if waiter.matches(message):
+                return self._remove(seq) if waiter.claim else message
+        return None
+
+    def add(self, message):
+        """登记新消息，唤醒所有匹配的非claim等待者，遇到第一个claim等待者时消息被取走"""
+        with self._lock:
+            matched = []
+            claimed = False
+            for waiter in self._waiters:
+                if waiter.matches(message):
+                    matched.append(waiter)
+                    if waiter.claim:
+                        claimed = True
+                        break
+            for waiter in matched:
+                self._waiters.remove(waiter)
+                waiter.result = message
+                waiter.event.set()
+            if claimed:
+                return
+
+            self._seq += 1
+            self._index(self._seq, message)
+            while len(self._messages) > self.capacity:
+                self._remove(next(iter(self._messages)))
+
+    def wait(self, correlation_id=None, routing_key=None, predicate=None, timeout=10, claim=True):
+        """等待匹配的消息，已收到则立即返回，超时抛出TimeoutError"""
+        waiter = _Waiter(correlation_id, routing_key, predicate, claim)
+        with self._lock:
+            message = self._find(waiter)
+            if message is not None:
+                return message
+            self._waiters.append(waiter)
+
+        if not waiter.event.wait(timeout):
+            with self._lock:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+            if waiter.result is None:
+                error = f"，匹配条件异常: {type(waiter.error).__name__}: {waiter.error}" if waiter.error else ""
+                raise TimeoutError(
+                    f"等待MQ消息超时({timeout}s): correlation_id={correlation_id}, routing_key={routing_key}{error}"
+                )
+        return waiter.result
+
+    def __len__(self):
+        return len(self._messages)
+
+
+class ConsumerPool:
+    """多消费者线程池：每个消费者使用独立连接/通道并设置prefetch，消息经有界队列交给工作线程处理，
+    处理结果由消费者线程批量确认；stop()时取消消费，处理完已收到的消息并确认后关闭连接
+
+    handler失败的消息会被nack且不重新入队
+    """
+
+    def __init__(self, client, queue_name, handler, envelope=False, **consumer_config):
+        self.client = client
+        self.queue_name = queue_name
+        self.handler = handler
+        self.envelope = envelope  # True时handler接收ReceivedMessage，否则接收解析后的消息体
+        self.config = {**DEFAULT_CONSUMER_CONFIG, **(client.config.get("consumer") or {}), **consumer_config}
+        self._buffer = queue.Queue(maxsize=self.config["queue_size"])
+        self._stopping = threading.Event()
+        self._workers_done = threading.Event()
+        self._cancelled = []
+        self._consumer_threads = []
+        self._worker_threads = []
+        self._stats_lock = threading.Lock()
+        self.processed = 0
+        self.failed = 0
+        self.acked = 0
+
+    def start(self):
+        for index in range(self.config["consumers"]):
+            cancelled = threading.Event()
+            self._cancelled.append(cancelled)
+            thread = Thread(target=self._consume, args=(cancelled,), name=f"mq-consumer-{index}", daemon=True)
+            thread.start()
+            self._consumer_threads.append(thread)
+        for index in range(self.config["workers"]):
+            thread = Thread(target=self._work, name=f"mq-worker-{index}", daemon=True)
+            thread.start()
+            self._worker_threads.append(thread)
+        logger.info(
+            f"MQ消费者池已启动: 队列={self.queue_name}, 消费者={self.config['consumers']}, "
+            f"工作线程={self.config['workers']}, prefetch={self.config['prefetch_count']}"
+        )
+        return self
+
+    def _consume(self, cancelled):
+        """消费者线程：独立连接，接收消息放入缓冲队列，并负责本通道的批量确认"""
+        connection = None
+        tracker = _AckTracker()
+        try:
+            connection = pika.BlockingConnection(self.client._connection_parameters())
+            channel = connection.channel()
+            channel.basic_qos(prefetch_count=self.config["prefetch_count"])
+
+            def on_message(ch, method, properties, body):
+                # 缓冲队列已满时阻塞等待，形成背压（prefetch限制了Broker继续推送）
+                data = _decode_body(body)
+                if self.envelope:
+                    data = ReceivedMessage(
+                        data, method.routing_key, getattr(properties, "correlation_id", None), properties,
+                        time.monotonic()
+                    )
+                self._buffer.put((tracker, method.delivery_tag, data))
+
+            consumer_tag = channel.basic_consume(queue=self.queue_name, on_message_callback=on_message)
+            last_flush = time.monotonic()
+            while True:
+                if self._stopping.is_set() and not cancelled.is_set():
+                    # 停止接收新消息，已预取但未分发的消息由pika自动nack回队列
+                    channel.basic_cancel(consumer_tag)
+                    cancelled.set()
+                connection.process_data_events(time_limit=min(self.config["ack_interval"], 0.1))
+
+                now = time.monotonic()
+                if tracker.pending() >= self.config["ack_batch_size"] or now - last_flush >= self.config["ack_interval"]:
+                    self._add_acked(tracker.flush(channel))
+                    last_flush = now
+                if cancelled.is_set() and self._workers_done.is_set():
+                    self._add_acked(tracker.flush(channel))
+                    break
+        except Exception as e:
+            logger.error(f"MQ消费者异常退出: 队列={self.queue_name}, 错误: {str(e)}")
+        finally:
+            cancelled.set()
+            if connection and connection.is_open:
+                connection.close()
+
+    def _work(self):
+        while True:
+            item = self._buffer.get()
+            if item is None:
+                return
+            tracker, delivery_tag, data = item
+            try:
+                self.handler(data)
+                success = True
+            except Exception as e:
+                logger.error(f"MQ消息处理失败: {str(e)}")
+                success = False
+            tracker.settle(delivery_tag, success)
+            with self._stats_lock:
+                self.processed += 1
+                self.failed += 0 if success else 1
+
+    def _add_acked(self, count):
+        if count:
+            with self._stats_lock:
+                self.acked += count
+
+    def stats(self):
+        with self._stats_lock:
+            return {"processed": self.processed, "failed": self.failed, "acked": self.acked,
+                    "buffered": self._buffer.qsize()}
+
+    def stop(self, timeout=30):
+        """停止消费：取消订阅 -> 处理完缓冲中的消息 -> 确认 -> 关闭连接"""
+        if self._stopping.is_set():
+            return
+        self._stopping.set()
+        deadline = time.monotonic() + timeout
+        for cancelled in self._cancelled:
+            cancelled.wait(max(0, deadline - time.monotonic()))
+        for _ in self._worker_threads:
+            self._buffer.put(None)
+        for thread in self._worker_threads:
+            thread.join(max(0, deadline - time.monotonic()))
+        self._workers_done.set()
+        for thread in self._consumer_threads:
+            thread.join(max(0, deadline - time.monotonic()))
+        logger.info(f"MQ消费者池已停止: 队列={self.queue_name}, 统计={self.stats()}")
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
 class RabbitMQClient:
     def __init__(self, config):
         self.config = config
         self.connection = None
         self.channel = None
         self.consume_threads = []
+        self.consumer_pools = []
+        self.message_indexes = {}  # 队列名 -> MessageIndex
+        self._watch_lock = threading.Lock()
+
+    def _connection_parameters(self):
+        credentials = pika.PlainCredentials(
+            self.config["user"],
+            os.getenv(self.config["password_key"])
+        )
+        return pika.ConnectionParameters(
+            host=self.config["host"],
+            port=self.config["port"],
+            credentials=credentials,
+            virtual_host=self.config.get("virtual_host", "/"),
+            heartbeat=600
+        )
 
     def connect(self):
         """建立MQ连接"""
@@ -21,20 +509,7 @@ class RabbitMQClient:
             return self.channel
 
         try:
-            credentials = pika.PlainCredentials(
-                self.config["user"],
-                os.getenv(self.config["password_key"])
-            )
-            
-            self.connection = pika.BlockingConnection(
-                pika.ConnectionParameters(
-                    host=self.config["host"],
-                    port=self.config["port"],
-                    credentials=credentials,
-                    virtual_host=self.config.get("virtual_host", "/"),
-                    heartbeat=600
-                )
-            )
+            self.connection = pika.BlockingConnection(self._connection_parameters())
             
             self.channel = self.connection.channel()
             logger.info(f"MQ连接成功: {self.config['host']}:{self.config['port']}")
@@ -60,10 +535,7 @@ class RabbitMQClient:
         routing_key = routing_key or queue_name
         
         # 序列化消息
-        if isinstance(message, dict):
-            message = json.dumps(message)
-        elif not isinstance(message, str):
-            message = str(message)
+        message, content_type = _serialize_message(message)
 
         self.channel.basic_publish(
             exchange=exchange,
@@ -71,14 +543,74 @@ class RabbitMQClient:
             body=message,
             properties=pika.BasicProperties(
                 delivery_mode=2,  # 消息持久化
-                content_type='application/json' if isinstance(message, dict) else 'text/plain'
+                content_type=content_type
             )
         )
         logger.info(f"MQ消息已发送: 队列={queue_name}, 内容={message[:100]}...")
 
+    def publish_batch(self, queue_name, messages, exchange='', routing_key=None,
+                      window=DEFAULT_CONFIRM_WINDOW, timeout=600):
+        """批量发送消息（发布确认模式）
+
+        使用独立连接的单个通道异步发送，未确认消息最多window条，按确认窗口推进而非逐条等待；
+        messages可为生成器，大批量时不必一次性载入内存。
+        返回统计：发送数、确认数、拒绝数(nacked)、耗时、发送速率(条/秒)、确认延迟(秒)
+        """
+        routing_key = routing_key or queue_name
+        publisher = _ConfirmPublisher(messages, exchange, routing_key, window)
+        start = time.monotonic()
+        try:
+            publisher.run(self._connection_parameters(), timeout)
+        except Exception as e:
+            logger.error(f"MQ批量发送失败: 队列={queue_name}, 已发送={publisher.published}, 错误: {str(e)}")
+            raise
+
+        stats = publisher.stats(time.monotonic() - start)
+        logger.info(
+            f"MQ批量发送完成: 队列={queue_name}, 发送={stats['published']}, 确认={stats['acked']}, "
+            f"拒绝={stats['nacked']}, 速率={stats['rate']}条/秒, "
+            f"确认延迟p50={stats['confirm_latency_p50'] * 1000:.1f}ms, p99={stats['confirm_latency_p99'] * 1000:.1f}ms"
+        )
+        if stats["nacked"]:
+            logger.warning(f"MQ批量发送存在未被Broker接受的消息: {stats['nacked']} 条")
+        return stats
+
+    def consume_pool(self, queue_name, handler, **consumer_config):
+        """启动多消费者线程池消费队列，参数见 DEFAULT_CONSUMER_CONFIG，返回ConsumerPool（调用stop()停止）"""
+        pool = ConsumerPool(self, queue_name, handler, **consumer_config).start()
+        self.consumer_pools.append(pool)
+        return pool
+
+    def watch(self, queue_name, capacity=DEFAULT_INDEX_CAPACITY, **consumer_config):
+        """开始监听队列并将消息放入索引（每个队列只启动一次），供await_message使用
+
+        需要在触发消息的接口调用之前执行，避免消息被其他消费者取走
+        """
+        with self._watch_lock:
+            index = self.message_indexes.get(queue_name)
+            if index is None:
+                index = MessageIndex(capacity)
+                self.consume_pool(queue_name, index.add, envelope=True, **consumer_config)
+                self.message_indexes[queue_name] = index
+            return index
+
+    def await_message(self, queue_name, predicate=None, correlation_id=None, routing_key=None,
+                      timeout=10, claim=True):
+        """等待队列中出现匹配的消息（按correlation_id/路由键索引查找，predicate对消息体做进一步过滤）
+
+        消息到达即返回ReceivedMessage，无需固定sleep；超时抛出TimeoutError
+        """
+        index = self.watch(queue_name)
+        start = time.monotonic()
+        message = index.wait(correlation_id, routing_key, predicate, timeout, claim)
+        logger.info(
+            f"MQ消息已到达: 队列={queue_name}, correlation_id={message.correlation_id}, "
+            f"路由键={message.routing_key}, 等待={time.monotonic() - start:.3f}s"
+        )
+        return message
+
     def consume_messages(self, queue_name, callback, auto_ack=True, max_messages=None):
-        """消费消息"""
-        self.connect()
+        """消费消息（消费线程使用独立连接，pika连接不能跨线程共用）"""
         self.declare_queue(queue_name)
         
         messages_received = 0
@@ -87,10 +619,7 @@ class RabbitMQClient:
             nonlocal messages_received
             try:
                 # 解析消息
-                try:
-                    data = json.loads(body)
-                except:
-                    data = body.decode('utf-8') if isinstance(body, bytes) else body
+                data = _decode_body(body)
                 
                 # 调用回调函数
                 callback(data)
@@ -106,29 +635,45 @@ class RabbitMQClient:
             if not auto_ack:
                 ch.basic_ack(delivery_tag=method.delivery_tag)
 
+        connection = pika.BlockingConnection(self._connection_parameters())
+        channel = connection.channel()
+
         # 启动消费线程
         def consume():
-            self.channel.basic_consume(
-                queue=queue_name,
-                on_message_callback=on_message,
-                auto_ack=auto_ack
-            )
-            logger.info(f"开始消费MQ消息: {queue_name}")
-            self.channel.start_consuming()
+            try:
+                channel.basic_consume(
+                    queue=queue_name,
+                    on_message_callback=on_message,
+                    auto_ack=auto_ack
+                )
+                logger.info(f"开始消费MQ消息: {queue_name}")
+                channel.start_consuming()
+            finally:
+                if connection.is_open:
+                    connection.close()
 
         thread = Thread(target=consume, daemon=True)
+        thread.connection, thread.channel = connection, channel
         thread.start()
         self.consume_threads.append(thread)
         return thread
 
     def close(self):
         """关闭连接"""
-        # 停止所有消费线程
+        for pool in self.consumer_pools:
+            pool.stop()
+        self.consumer_pools.clear()
+        self.message_indexes.clear()
+
+        # 停止所有消费线程（通过线程安全回调在消费线程内停止消费）
         for thread in self.consume_threads:
             if thread.is_alive():
-                if self.channel:
-                    self.channel.stop_consuming()
+                try:
+                    thread.connection.add_callback_threadsafe(thread.channel.stop_consuming)
+                except Exception:
+                    pass
                 thread.join(timeout=5)
+        self.consume_threads.clear()
         
         if self.connection and not self.connection.is_closed:
             self.connection.close()
@@ -0,0 +1,349 @@
+import argparse
+import bisect
+import copy
+import importlib
+import json
+import math
+import os
+import queue
+import random
+import re
+import threading
+import time
+from datetime import datetime
+from utils.log_utils import logger, set_log_sampled, LOG_DIR
+from utils.metrics_utils import LatencyHistogram
+
+# 压测结果输出目录
+PERF_REPORT_DIR = os.path.join(os.path.dirname(LOG_DIR), "perf")
+
+_PLACEHOLDER = re.compile(r"\$\{(\w+)\}")
+
+
+def _import_class(path):
+    """按 "模块.类名" 导入类，如 api.user_api.UserAPI"""
+    module_name, class_name = path.rsplit(".", 1)
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def _render(value, context):
+    """替换 ${name} 占位符：优先取虚拟用户上下文变量，其次取环境变量；整个值为占位符时保留原类型"""
+    if isinstance(value, str):
+        match = _PLACEHOLDER.fullmatch(value)
+        if match and match.group(1) in context:
+            return context[match.group(1)]
+        return _PLACEHOLDER.sub(
+            lambda m: str(context.get(m.group(1), os.getenv(m.group(1), m.group(0)))), value
+        )
+    if isinstance(value, dict):
+        return {key: _render(item, context) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_render(item, context) for item in value]
+    return value
+
+
+def _extract(data, path):
+    """按 "." 分隔的路径取值，如 data.token"""
+    for key in path.split("."):
+        data = data[int(key)] if isinstance(data, list) else data[key]
+    return data
+
+
+class Scenario:
+    """压测场景：api_class 为 BaseAPI 子类，call(api, context) 执行一次接口调用，weight 为选中权重"""
+
+    def __init__(self, name, api_class, call, weight=1):
+        self.name = name
+        self.api_class = api_class
+        self.call = call
+        self.weight = weight
+
+    @classmethod
+    def from_config(cls, config):
+        """由配置创建场景：直接调用接口类中已有的方法，参数支持 ${变量} 占位符"""
+        method = config["method"]
+        args = config.get("args", [])
+        kwargs = config.get("kwargs", {})
+
+        def call(api, context):
+            return getattr(api, method)(*_render(args, context), **_render(kwargs, context))
+
+        return cls(config.get("name", method), _import_class(config["api"]), call, config.get("weight", 1))
+
+
+class EndpointStats:
+    """单个场景的统计：延迟直方图、错误数和错误样例"""
+
+    def __init__(self):
+        self.histogram = LatencyHistogram()
+        self._lock = threading.Lock()
+        self.errors = 0
+        self.error_samples = []
+
+    def record_error(self, error):
+        with self._lock:
+            self.errors += 1
+            message = f"{type(error).__name__}: {error}"
+            if len(self.error_samples) < 5 and message not in self.error_samples:
+                self.error_samples.append(message)
+
+
+class LoadRunner:
+    """压测执行器：复用接口层的 BaseAPI 子类（保留加解密与日志行为），多个虚拟用户并发执行加权场景
+
+    - 闭合模型（未设置target_rps）：每个虚拟用户连续发起请求，ramp_up期间逐个启动
+    - 开放模型（设置target_rps）：按固定到达率发起请求，ramp_up期间到达率线性增长；
+      延迟从计划发起时间算起，虚拟用户不足时排队时间计入延迟，避免掩盖服务端变慢
+    """
+
+    def __init__(self, env_config, scenarios, virtual_users=10, duration=60, ramp_up=0, target_rps=None,
+                 sample_rate=0.0, setup=None):
+        self.env_config = self._prepare_env_config(env_config, virtual_users)
+        self.scenarios = scenarios
+        self.virtual_users = virtual_users
+        self.duration = duration
+        self.ramp_up = min(ramp_up, duration)
+        self.target_rps = target_rps
+        self.sample_rate = sample_rate
+        self.setup = setup
+        self.stats = {scenario.name: EndpointStats() for scenario in scenarios}
+        self._cum_weights = []
+        total = 0
+        for scenario in scenarios:
+            total += scenario.weight
+            self._cum_weights.append(total)
+        self._stop = threading.Event()
+        self._dropped_lock = threading.Lock()
+        self.dropped = 0
+        self.backlog_max = 0
+
+    @staticmethod
+    def _prepare_env_config(env_config, virtual_users):
+        """连接池大小至少为虚拟用户数，避免请求排队等待连接"""
+        config = copy.deepcopy(env_config)
+        pool = config.setdefault("pool", {})
+        pool["pool_maxsize"] = max(pool.get("pool_maxsize", 10), virtual_users)
+        return config
+
+    @classmethod
+    def from_config(cls, env_config, perf_config, **overrides):
+        """由 config/perf_config.yaml 创建，overrides中非None的项覆盖配置"""
+        options = {key: perf_config.get(key) for key in
+                   ("virtual_users", "duration", "ramp_up", "target_rps", "sample_rate", "setup")}
+        options.update({key: value for key, value in overrides.items() if value is not None})
+        options = {key: value for key, value in options.items() if value is not None}
+        scenarios = [Scenario.from_config(item) for item in perf_config["scenarios"]]
+        return cls(env_config, scenarios, **options)
+
+    def _start_user(self):
+        """创建虚拟用户：每个接口类一个实例（连接池在进程内共享），执行setup并返回上下文"""
+        apis = {}
+        for scenario in self.scenarios:
+            if scenario.api_class not in apis:
+                apis[scenario.api_class] = scenario.api_class(self.env_config)
+        context = {}
+        if self.setup:
+            api_class = _import_class(self.setup["api"])
+            api = apis.get(api_class) or api_class(self.env_config)
+            response = getattr(api, self.setup["method"])(
+                *_render(self.setup.get("args", []), context), **_render(self.setup.get("kwargs", {}), context)
+            )
+            for name, path in (self.setup.get("extract") or {}).items():
+                context[name] = _extract(response, path)
+        return apis, context
+
+    def _execute(self, apis, context, rng, intended_start=None):
+        scenario = self.scenarios[bisect.bisect(self._cum_weights, rng.random() * self._cum_weights[-1])]
+        stats = self.stats[scenario.name]
+        set_log_sampled(rng.random() < self.sample_rate)
+        start = time.monotonic()
+        try:
+            scenario.call(apis[scenario.api_class], context)
+        except Exception as e:
+            stats.record_error(e)
+        finally:
+            stats.histogram.record(time.monotonic() - (intended_start or start))
+
+    def _closed_user(self, index, start, end):
+        """闭合模型虚拟用户：ramp_up期间按序号错开启动，之后连续执行"""
+        rng = random.Random()
+        delay = self.ramp_up * index / self.virtual_users
+        if self._stop.wait(max(0, start + delay - time.monotonic())):
+            return
+        try:
+            apis, context = self._start_user()
+            while time.monotonic() < end and not self._stop.is_set():
+                self._execute(apis, context, rng)
+        except Exception as e:
+            logger.error(f"虚拟用户{index}初始化失败: {str(e)}")
+        finally:
+            set_log_sampled(True)
+
+    def _arrivals(self):
+        """开放模型的计划发起时间（相对开始时间的秒数）：ramp_up期间到达率线性增长，之后保持target_rps"""
+        rate = self.target_rps
+        ramp_count = rate * self.ramp_up / 2
+        n = 0
+        while True:
+            n += 1
+            if n <= ramp_count:
+                offset = math.sqrt(2 * self.ramp_up * n / rate)
+            else:
+                offset = self.ramp_up + (n - ramp_count) / rate
+            if offset >= self.duration:
+                return
+            yield offset
+
+    def _open_user(self, index, arrivals, deadline):
+        rng = random.Random()
+        try:
+            apis, context = self._start_user()
+        except Exception as e:
+            logger.error(f"虚拟用户{index}初始化失败: {str(e)}")
+            apis = None
+        try:
+            while True:
+                intended_start = arrivals.get()
+                if intended_start is None:
+                    return
+                if apis is None or time.monotonic() > deadline:
+                    # 超过收尾时间仍未发起的请求直接丢弃
+                    with self._dropped_lock:
+                        self.dropped += 1
+                    continue
+                self._execute(apis, context, rng, intended_start)
+        finally:
+            set_log_sampled(True)
+
+    def _dispatch(self, arrivals, start):
+        for offset in self._arrivals():
+            if self._stop.wait(max(0, start + offset - time.monotonic())):
+                break
+            arrivals.put(start + offset)
+            self.backlog_max = max(self.backlog_max, arrivals.qsize())
+        for _ in range(self.virtual_users):
+            arrivals.put(None)
+
+    def run(self):
+        """执行压测，返回统计报告"""
+        mode = f"开放模型 目标RPS={self.target_rps}" if self.target_rps else "闭合模型"
+        logger.info(
+            f"开始压测: {mode}, 虚拟用户={self.virtual_users}, 时长={self.duration}s, 加压={self.ramp_up}s, "
+            f"场景={[s.name for s in self.scenarios]}, 日志采样={self.sample_rate}"
+        )
+        start = time.monotonic()
+        end = start + self.duration
+        if self.target_rps:
+            arrivals = queue.Queue()
+            deadline = end + self.env_config.get("timeout", 10)
+            threads = [threading.Thread(target=self._open_user, args=(i, arrivals, deadline), daemon=True)
+                       for i in range(self.virtual_users)]
+            threads.append(threading.Thread(target=self._dispatch, args=(arrivals, start), daemon=True))
+        else:
+            threads = [threading.Thread(target=self._closed_user, args=(i, start, end), daemon=True)
+                       for i in range(self.virtual_users)]
+
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                thread.join()
+        except KeyboardInterrupt:
+            logger.warning("压测被中断，等待进行中的请求结束")
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+
+        report = self.report(time.monotonic() - start)
+        self._log_report(report)
+        return report
+
+    def report(self, elapsed):
+        endpoints = {}
+        total = LatencyHistogram()
+        errors = 0
+        for name, stats in self.stats.items():
+            total.merge(stats.histogram)
+            errors += stats.errors
+            endpoints[name] = {
+                **stats.histogram.summary(),
+                "rps": round(stats.histogram.count / elapsed, 1) if elapsed else 0.0,
+                "errors": stats.errors,
+                "error_samples": stats.error_samples
+            }
+        return {
+            "elapsed": round(elapsed, 3),
+            "virtual_users": self.virtual_users,
+            "target_rps": self.target_rps,
+            "requests": total.count,
+            "errors": errors,
+            "rps": round(total.count / elapsed, 1) if elapsed else 0.0,
+            "dropped": self.dropped,
+            "backlog_max": self.backlog_max,
+            "total": total.summary(),
+            "endpoints": endpoints
+        }
+
+    @staticmethod
+    def _log_report(report):
+        lines = [f"{'场景':<24}{'请求数':>10}{'错误':>8}{'RPS':>10}{'p50(ms)':>10}{'p90(ms)':>10}{'p99(ms)':>10}{'max(ms)':>10}"]
+        rows = list(report["endpoints"].items()) + [("总计", {**report["total"], "rps": report["rps"],
+                                                               "errors": report["errors"]})]
+        for name, item in rows:
+            lines.append(
+                f"{name:<24}{item['count']:>10}{item['errors']:>8}{item['rps']:>10}"
+                f"{item['p50']:>10}{item['p90']:>10}{item['p99']:>10}{item['max']:>10}"
+            )
+        if report["dropped"]:
+            lines.append(f"未发起（超过收尾时间）: {report['dropped']}，最大排队: {report['backlog_max']}")
+        logger.info("压测结果:\n" + "\n".join(lines))
+
+
+def save_report(report, output=None):
+    """保存压测报告为JSON，返回文件路径"""
+    if output is None:
+        os.makedirs(PERF_REPORT_DIR, exist_ok=True)
+        output = os.path.join(PERF_REPORT_DIR, f"perf_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    logger.info(f"压测报告已保存: {output}")
+    return output
+
+
+def main(argv=None):
+    """命令行入口：python -m utils.perf_utils --env test --vus 50 --rps 200 --duration 60"""
+    from utils.config_utils import ReadOnlyDict, load_env_config, load_perf_config
+    from utils.stub_utils import StubServer
+
+    parser = argparse.ArgumentParser(description="复用接口层定义的压测执行器")
+    parser.add_argument("--env", default="test", help="测试环境：test（默认）/staging")
+    parser.add_argument("--vus", type=int, dest="virtual_users", help="并发虚拟用户数")
+    parser.add_argument("--rps", type=float, dest="target_rps", help="目标每秒请求数（开放模型）")
+    parser.add_argument("--duration", type=float, help="压测时长（秒）")
+    parser.add_argument("--ramp-up", type=float, dest="ramp_up", help="加压时间（秒）")
+    parser.add_argument("--sample-rate", type=float, dest="sample_rate", help="日志采样比例")
+    parser.add_argument("--output", help="JSON报告输出路径")
+    parser.add_argument("--stub", action="store_true", help="压测进程内桩服务（用于评估客户端本身的吞吐）")
+    args = parser.parse_args(argv)
+
+    env_config = load_env_config(args.env)
+    stub = None
+    if args.stub:
+        stub = StubServer(env_config.get("stub"))
+        env_config = ReadOnlyDict(env_config, base_url=stub.start())
+    runner = LoadRunner.from_config(
+        env_config, load_perf_config(args.env),
+        virtual_users=args.virtual_users, target_rps=args.target_rps, duration=args.duration,
+        ramp_up=args.ramp_up, sample_rate=args.sample_rate
+    )
+    try:
+        report = runner.run()
+    finally:
+        if stub:
+            stub.stop()
+    save_report(report, args.output)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -1,79 +1,367 @@
 import redis
 import os
+import threading
+import uuid
+from contextlib import contextmanager
+from itertools import islice
+from redis.backoff import ExponentialBackoff
+from redis.retry import Retry
 from dotenv import load_dotenv
 from utils.log_utils import logger
 
 load_dotenv()
 
+# 默认连接池配置，可在 config/redis_config.yaml 的 pool 节点中覆盖
+DEFAULT_POOL_CONFIG = {
+    "max_connections": 50,        # 最大连接数
+    "timeout": 5,                 # 连接耗尽时等待的秒数
+    "health_check_interval": 30,  # 连接空闲超过该秒数时，使用前先PING检查
+    "socket_timeout": 5,          # 读写超时（秒）
+    "socket_connect_timeout": 5,  # 建连超时（秒）
+    "retries": 3                  # 连接断开/超时后自动重连重试次数
+}
+
+
+class PoolMetrics:
+    """Redis连接池指标：使用中、累计创建、读写/建连错误次数、获取连接失败次数（等待超时或建连失败）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.created = 0
+        self.in_use = 0
+        self.errors = 0
+        self.acquire_errors = 0
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def snapshot(self):
+        with self._lock:
+            return {"created": self.created, "in_use": self.in_use, "errors": self.errors,
+                    "acquire_errors": self.acquire_errors}
+
+
+def _counting_connection_class(metrics):
+    """生成记录连接/读写错误的连接类"""
+    class CountingConnection(redis.Connection):
+        def connect(self):
+            try:
+                return super().connect()
+            except (redis.ConnectionError, redis.TimeoutError):
+                metrics.incr("errors")
+                raise
+
+        def send_packed_command(self, command, check_health=True):
+            try:
+                return super().send_packed_command(command, check_health)
+            except (redis.ConnectionError, redis.TimeoutError):
+                metrics.incr("errors")
+                raise
+
+        def read_response(self, *args, **kwargs):
+            try:
+                return super().read_response(*args, **kwargs)
+            except (redis.ConnectionError, redis.TimeoutError):
+                metrics.incr("errors")
+                raise
+
+    return CountingConnection
+
+
+class InstrumentedConnectionPool(redis.BlockingConnectionPool):
+    """带指标统计的阻塞式连接池，连接耗尽时等待而非报错"""
+
+    def __init__(self, **kwargs):
+        self.metrics = PoolMetrics()
+        # 已借出的连接：获取连接失败时父类会直接调用release()，只有借出过的连接才扣减in_use
+        self._checked_out = set()
+        self._checked_out_lock = threading.Lock()
+        super().__init__(connection_class=_counting_connection_class(self.metrics), **kwargs)
+
+    def make_connection(self):
+        connection = super().make_connection()
+        self.metrics.incr("created")
+        return connection
+
+    def get_connection(self, command_name, *keys, **options):
+        try:
+            connection = super().get_connection(command_name, *keys, **options)
+        except (redis.ConnectionError, redis.TimeoutError):
+            self.metrics.incr("acquire_errors")
+            raise
+        with self._checked_out_lock:
+            self._checked_out.add(connection)
+        self.metrics.incr("in_use")
+        return connection
+
+    def release(self, connection):
+        with self._checked_out_lock:
+            checked_out = connection in self._checked_out
+            self._checked_out.discard(connection)
+        if checked_out:
+            self.metrics.incr("in_use", -1)
+        super().release(connection)
+
+    def reset(self):
+        # 初始化及fork后父类会重置连接池，此时没有借出的连接
+        with self._checked_out_lock:
+            self.metrics.incr("in_use", -len(self._checked_out))
+            self._checked_out.clear()
+        super().reset()
+
+    def stats(self):
+        return {**self.metrics.snapshot(), "max_connections": self.max_connections}
+
+
+# 当前进程（xdist worker）内共享的连接池，按连接参数区分
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_connection_pool(config):
+    """获取当前进程共享的Redis连接池"""
+    pool_config = {**DEFAULT_POOL_CONFIG, **(config.get("pool") or {})}
+    key = (config["host"], config["port"], config["db"], config.get("decode_responses", True),
+           tuple(sorted(pool_config.items())))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = InstrumentedConnectionPool(
+                host=config["host"],
+                port=config["port"],
+                password=os.getenv(config["password_key"]),
+                db=config["db"],
+                decode_responses=config.get("decode_responses", True),
+                max_connections=pool_config["max_connections"],
+                timeout=pool_config["timeout"],
+                health_check_interval=pool_config["health_check_interval"],
+                socket_timeout=pool_config["socket_timeout"],
+                socket_connect_timeout=pool_config["socket_connect_timeout"],
+                retry=Retry(ExponentialBackoff(), pool_config["retries"]),
+                retry_on_error=[redis.ConnectionError, redis.TimeoutError]
+            )
+            _pools[key] = pool
+        return pool
+
+
+def get_redis_pool_stats():
+    """当前进程所有共享连接池的指标，键为 host:port/db"""
+    with _pools_lock:
+        pools = list(_pools.values())
+    return {
+        f"{pool.connection_kwargs['host']}:{pool.connection_kwargs['port']}/db{pool.connection_kwargs['db']}": pool.stats()
+        for pool in pools
+    }
+
+
+def close_redis_pools():
+    """断开所有共享连接池"""
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.disconnect()
+        _pools.clear()
+
+
+# 本次运行的ID，用于生成键命名空间（多个CI任务共用Redis时可通过 TEST_RUN_ID 指定）
+RUN_ID = os.getenv("TEST_RUN_ID") or uuid.uuid4().hex[:8]
+
+
+def default_namespace():
+    """当前worker的键命名空间：test:{运行ID}:{worker}"""
+    return f"test:{RUN_ID}:{os.getenv('PYTEST_XDIST_WORKER', 'master')}"
+
+
 class RedisClient:
-    def __init__(self, config):
+    def __init__(self, config, namespace=None):
         self.config = config
         self.client = None
+        # 设置命名空间后，所有键自动加上 "{namespace}:" 前缀，写入的键会被记录以便用例结束后清理
+        self.namespace = namespace
+        self._written = set()
+        self._written_lock = threading.Lock()
+
+    def key(self, key):
+        """返回加上命名空间前缀后的实际键名"""
+        return f"{self.namespace}:{key}" if self.namespace else key
+
+    def _strip(self, key):
+        if self.namespace and key.startswith(self.namespace + ":"):
+            return key[len(self.namespace) + 1:]
+        return key
+
+    def track(self, *keys):
+        """记录需要清理的键（如被测系统在命名空间下写入的键），传入不带前缀的键名"""
+        with self._written_lock:
+            self._written.update(self.key(key) for key in keys)
+
+    def _track_raw(self, raw_keys):
+        if self.namespace:
+            with self._written_lock:
+                self._written.update(raw_keys)
 
     def connect(self):
-        """建立Redis连接"""
+        """建立Redis连接（共享连接池；健康检查与断线重连由连接池完成，不再每次操作前PING）"""
         if self.client:
-            try:
-                self.client.ping()
-                return self.client
-            except Exception:
-                logger.warning("Redis连接已断开，尝试重新连接")
+            return self.client
 
         try:
-            self.client = redis.Redis(
-                host=self.config["host"],
-                port=self.config["port"],
-                password=os.getenv(self.config["password_key"]),
-                db=self.config["db"],
-                decode_responses=self.config.get("decode_responses", True),
-                socket_connect_timeout=5
-            )
-            self.client.ping()
-            logger.info(f"Redis连接成功: {self.config['host']}:{self.config['port']}/db{self.config['db']}")
+            pool = get_connection_pool(self.config)
+            client = redis.Redis(connection_pool=pool)
+            # 仅在连接池首次使用时PING验证配置，之后由连接池按间隔做健康检查
+            if pool.metrics.created == 0:
+                client.ping()
+                logger.info(f"Redis连接成功: {self.config['host']}:{self.config['port']}/db{self.config['db']}")
+            self.client = client
             return self.client
         except Exception as e:
             logger.error(f"Redis连接失败: {str(e)}")
             raise
 
+    def pool_stats(self):
+        """连接池指标：in_use=使用中连接数，created=累计创建连接数，errors=连接/读写错误次数"""
+        return get_connection_pool(self.config).stats()
+
     def get(self, key):
         """获取键值"""
         self.connect()
-        value = self.client.get(key)
+        value = self.client.get(self.key(key))
         logger.debug(f"Redis获取: {key} -> {value}")
         return value
 
     def set(self, key, value, expire=None):
         """设置键值"""
         self.connect()
-        result = self.client.set(key, value, ex=expire)
+        result = self.client.set(self.key(key), value, ex=expire)
+        self._track_raw([self.key(key)])
         logger.debug(f"Redis设置: {key} = {value}, 过期时间: {expire}")
         return result
 
     def delete(self, key):
         """删除键"""
         self.connect()
-        result = self.client.delete(key)
+        result = self.client.delete(self.key(key))
+        with self._written_lock:
+            self._written.discard(self.key(key))
         logger.debug(f"Redis删除: {key} -> {'成功' if result else '失败'}")
         return result
 
-    def keys(self, pattern="*"):
-        """查找匹配的键"""
+    def get_many(self, keys):
+        """批量获取键值（MGET，一次往返），返回 {键: 值}，不存在的键值为None"""
+        self.connect()
+        keys = list(keys)
+        if not keys:
+            return {}
+        values = self.client.mget([self.key(key) for key in keys])
+        logger.debug(f"Redis批量获取: {len(keys)} 个键")
+        return dict(zip(keys, values))
+
+    def set_many(self, mapping, expire=None):
+        """批量设置键值（无过期时间用MSET，否则用管道批量SET）"""
         self.connect()
-        return self.client.keys(pattern)
+        if not mapping:
+            return True
+        raw_mapping = {self.key(key): value for key, value in mapping.items()}
+        if expire is None:
+            result = self.client.mset(raw_mapping)
+        else:
+            with self.pipeline(transaction=False) as pipe:
+                for key, value in raw_mapping.items():
+                    pipe.set(key, value, ex=expire)
+            result = True
+        self._track_raw(raw_mapping)
+        logger.debug(f"Redis批量设置: {len(mapping)} 个键, 过期时间: {expire}")
+        return result
+
+    def _unlink(self, raw_keys, batch_size=500):
+        """按实际键名批量删除（管道中每batch_size个键一条UNLINK，一次往返，后台释放内存）"""
+        iterator = iter(raw_keys)
+        with self.pipeline(transaction=False) as pipe:
+            while True:
+                batch = list(islice(iterator, batch_size))
+                if not batch:
+                    break
+                pipe.unlink(*batch)
+                if self.namespace:
+                    with self._written_lock:
+                        self._written.difference_update(batch)
+        return sum(pipe.results)
+
+    def delete_many(self, keys, batch_size=500):
+        """批量删除键，返回删除数量"""
+        self.connect()
+        deleted = self._unlink((self.key(key) for key in keys), batch_size)
+        logger.debug(f"Redis批量删除: {deleted} 个键")
+        return deleted
+
+    @contextmanager
+    def pipeline(self, transaction=True):
+        """管道上下文管理器，退出时一次性执行；transaction=True时以MULTI/EXEC事务执行
+
+        执行结果保存在 pipe.results 中；管道使用实际键名，命名空间下请用 self.key() 生成键名并 track() 记录
+        """
+        self.connect()
+        pipe = self.client.pipeline(transaction=transaction)
+        try:
+            yield pipe
+            pipe.results = pipe.execute()
+        finally:
+            pipe.reset()
+
+    def scan_iter(self, pattern="*", count=1000):
+        """使用SCAN增量遍历匹配的键（不阻塞Redis），count为每批扫描数量，返回不带命名空间前缀的键名"""
+        self.connect()
+        for key in self.client.scan_iter(match=self.key(pattern), count=count):
+            yield self._strip(key)
+
+    def keys(self, pattern="*", count=1000):
+        """查找匹配的键（基于SCAN，避免KEYS阻塞共享Redis）"""
+        return list(self.scan_iter(pattern, count))
+
+    def delete_by_prefix(self, prefix, batch_size=500):
+        """删除指定前缀的所有键（SCAN + 管道批量UNLINK），返回删除数量"""
+        self.connect()
+        deleted = 0
+        keys = self.client.scan_iter(match=f"{self.key(prefix)}*", count=batch_size)
+        while True:
+            batch = list(islice(keys, batch_size))
+            if not batch:
+                break
+            deleted += self._unlink(batch, batch_size)
+        logger.info(f"Redis按前缀删除: {self.key(prefix)}, 共 {deleted} 个键")
+        return deleted
+
+    def cleanup(self, scan=False, batch_size=500):
+        """删除本客户端写入/记录的键（管道批量UNLINK），scan=True时额外扫描删除整个命名空间下的键
+
+        用于替代 flush_db()，多个worker/CI任务共用同一个Redis时互不影响
+        """
+        with self._written_lock:
+            written = list(self._written)
+            self._written.clear()
+        deleted = 0
+        if written:
+            self.connect()
+            deleted = self._unlink(written, batch_size)
+        if scan and self.namespace:
+            deleted += self.delete_by_prefix("", batch_size)
+        logger.debug(f"Redis命名空间清理: {self.namespace}, 共删除 {deleted} 个键")
+        return deleted
 
     def flush_db(self):
-        """清空当前数据库"""
+        """清空当前数据库（会影响共用该库的其他worker，并行执行时请使用命名空间 + cleanup()）"""
         self.connect()
         logger.warning("清空Redis当前数据库")
         return self.client.flushdb()
 
     def close(self):
-        """关闭连接"""
+        """关闭连接（归还连接池，连接池在会话结束时统一断开）"""
         if self.client:
             self.client.close()
+            self.client = None
             logger.info("Redis连接已关闭")
 
-def get_redis_client(env="test"):
+def get_redis_client(env="test", namespace=None):
     """快捷获取Redis客户端"""
     from utils.config_utils import load_redis_config
-    return RedisClient(load_redis_config(env))
+    return RedisClient(load_redis_config(env), namespace=namespace)
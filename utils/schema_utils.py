@@ -0,0 +1,79 @@
+import os
+import threading
+from jsonschema.validators import validator_for
+from referencing import Registry, Resource
+from referencing.jsonschema import DRAFT7
+from utils.config_utils import PROJECT_ROOT, load_schema
+from utils.log_utils import logger
+
+SCHEMA_DIR = os.path.join(PROJECT_ROOT, "config", "schemas")
+
+
+class SchemaRegistry:
+    """Schema校验器注册表：每个Schema只编译一次，支持跨文件$ref引用
+
+    引用其他Schema文件时按文件名引用，如 {"$ref": "user_schema.json#/properties/data"}
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._registry = None
+        self._validators = {}
+
+    def _build_registry(self):
+        """将目录下所有Schema文件注册为可被$ref解析的资源"""
+        resources = []
+        for file_name in sorted(os.listdir(SCHEMA_DIR)):
+            if not file_name.endswith(".json"):
+                continue
+            schema = load_schema(file_name[:-len(".json")])
+            resource = Resource.from_contents(schema, default_specification=DRAFT7)
+            resources.append((file_name, resource))
+            if resource.id():
+                resources.append((resource.id(), resource))
+        return Registry().with_resources(resources)
+
+    def get_validator(self, schema_name):
+        """获取编译后的校验器，Schema文件修改后自动重新编译"""
+        schema = load_schema(schema_name)
+        cached = self._validators.get(schema_name)
+        if cached and cached[0] is schema:
+            return cached[1]
+
+        with self._lock:
+            cached = self._validators.get(schema_name)
+            if cached and cached[0] is schema:
+                return cached[1]
+
+            # Schema文件发生变化时，引用关系可能随之变化，重建注册表
+            if cached or self._registry is None:
+                self._registry = self._build_registry()
+            validator_cls = validator_for(schema)
+            validator_cls.check_schema(schema)
+            validator = validator_cls(schema, registry=self._registry)
+            self._validators[schema_name] = (schema, validator)
+            logger.debug(f"Schema已编译: {schema_name}")
+            return validator
+
+    def iter_errors(self, instance, schema_name):
+        """返回全部校验错误（单次遍历，不重复校验）"""
+        return list(self.get_validator(schema_name).iter_errors(instance))
+
+    def validate_many(self, instances, schema_name):
+        """批量校验列表数据，返回 [(下标, 错误), ...]"""
+        validator = self.get_validator(schema_name)
+        errors = []
+        for index, instance in enumerate(instances):
+            for error in validator.iter_errors(instance):
+                errors.append((index, error))
+        return errors
+
+    def clear(self):
+        """清空已编译的校验器"""
+        with self._lock:
+            self._registry = None
+            self._validators.clear()
+
+
+# 全局Schema注册表
+schema_registry = SchemaRegistry()
@@ -0,0 +1,164 @@
+import json
+import os
+import yaml
+from pathlib import Path
+from utils.db_utils import quote_identifier, backup_table_name, new_backup_token
+from utils.log_utils import logger
+
+# 单条INSERT语句最多插入的行数
+SEED_BATCH_SIZE = 1000
+
+
+def _expand_env(value):
+    """替换数据中的环境变量占位符，如 ${TEST_USERNAME}"""
+    if isinstance(value, str):
+        return os.path.expandvars(value)
+    return value
+
+
+def load_fixture(file_path):
+    """加载造数文件
+
+    YAML: 顶层为 {表名: [行, ...]}
+    JSONL: 文件名即表名（如 t_user.jsonl），每行一条记录
+    """
+    path = Path(file_path)
+    if not path.exists():
+        raise FileNotFoundError(f"造数文件不存在: {file_path}")
+
+    if path.suffix == ".jsonl":
+        with open(path, "r", encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+        return {path.stem: rows}
+
+    with open(path, "r", encoding="utf-8") as f:
+        data = yaml.load(f, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader))
+    if not isinstance(data, dict) or not all(isinstance(rows, list) for rows in data.values()):
+        raise ValueError(f"造数文件格式错误，应为 {{表名: [行, ...]}}: {file_path}")
+    return data
+
+
+class DataSeeder:
+    """批量造数：多行INSERT + 单事务写入，记录创建的数据以便批量清理
+
+    数据不带主键时，自增主键的获取方式：
+    - 指定unique_key（如 username）时，插入后按该列一次查询取回主键，不依赖自增ID连续
+    - 否则按 lastrowid ~ lastrowid+rowcount 推算，要求 innodb_autoinc_lock_mode <= 1
+      （单条多行INSERT的自增ID连续；MySQL 8默认值为2，并发插入时可能不连续，此时应指定unique_key）
+    """
+
+    def __init__(self, db_client, key="id", batch_size=SEED_BATCH_SIZE, unique_key=None):
+        self.db_client = db_client
+        self.key = key
+        self.unique_key = unique_key
+        self.batch_size = batch_size
+        self.created = {}  # 表名 -> 创建的主键列表
+        self._backups = []
+        self._backup_token = new_backup_token()
+
+    def _insert_batch(self, cursor, table, columns, rows):
+        """单条多行INSERT写入一批数据，返回创建的主键"""
+        placeholders = "(" + ", ".join(["%s"] * len(columns)) + ")"
+        sql = (
+            f"INSERT INTO {quote_identifier(table)} ({', '.join(quote_identifier(c) for c in columns)}) "
+            f"VALUES {', '.join([placeholders] * len(rows))}"
+        )
+        params = [_expand_env(row.get(column)) for row in rows for column in columns]
+        cursor.execute(sql, params)
+
+        if self.key in columns:
+            return [_expand_env(row[self.key]) for row in rows]
+        if self.unique_key in columns:
+            values = [_expand_env(row[self.unique_key]) for row in rows]
+            cursor.execute(
+                f"SELECT {quote_identifier(self.key)} AS k, {quote_identifier(self.unique_key)} AS u "
+                f"FROM {quote_identifier(table)} WHERE {quote_identifier(self.unique_key)} IN "
+                f"({', '.join(['%s'] * len(values))})",
+                values
+            )
+            keys = {row["u"]: row["k"] for row in cursor.fetchall()}
+            return [keys[value] for value in values]
+        return list(range(cursor.lastrowid, cursor.lastrowid + cursor.rowcount))
+
+    def seed(self, fixtures):
+        """写入造数数据，fixtures为 {表名: [行, ...]} 或造数文件路径，全部数据在一个事务中提交"""
+        if isinstance(fixtures, (str, Path)):
+            fixtures = load_fixture(fixtures)
+
+        created = {}
+        with self.db_client.get_cursor(commit=True) as cursor:
+            for table, rows in fixtures.items():
+                if not rows:
+                    continue
+                # 相同列集合的行合并为同一条INSERT
+                groups = {}
+                for row in rows:
+                    groups.setdefault(tuple(row.keys()), []).append(row)
+                for columns, group in groups.items():
+                    for start in range(0, len(group), self.batch_size):
+                        keys = self._insert_batch(cursor, table, list(columns), group[start:start + self.batch_size])
+                        created.setdefault(table, []).extend(keys)
+                logger.info(f"造数完成: 表={table}, 行数={len(rows)}")
+
+        # 事务提交成功后才记录，回滚时无需清理
+        for table, keys in created.items():
+            self.created.setdefault(table, []).extend(keys)
+        return created
+
+    def cleanup(self):
+        """按记录的主键批量删除本次创建的数据（按创建的逆序删除表，兼容外键依赖）"""
+        if not self.created:
+            return
+
+        with self.db_client.get_cursor(commit=True) as cursor:
+            for table in reversed(list(self.created)):
+                keys = self.created[table]
+                for start in range(0, len(keys), self.batch_size):
+                    batch = keys[start:start + self.batch_size]
+                    cursor.execute(
+                        f"DELETE FROM {quote_identifier(table)} WHERE {quote_identifier(self.key)} IN "
+                        f"({', '.join(['%s'] * len(batch))})",
+                        batch
+                    )
+                logger.info(f"造数清理完成: 表={table}, 行数={len(keys)}")
+        self.created.clear()
+
+    def truncate(self, tables):
+        """快速清空表（TRUNCATE，忽略外键检查）"""
+        with self.db_client.get_cursor(commit=True) as cursor:
+            cursor.execute("SET FOREIGN_KEY_CHECKS = 0")
+            try:
+                for table in tables:
+                    cursor.execute(f"TRUNCATE TABLE {quote_identifier(table)}")
+                    logger.info(f"已清空表: {table}")
+            finally:
+                cursor.execute("SET FOREIGN_KEY_CHECKS = 1")
+
+    def backup(self, tables):
+        """在服务端将表数据复制到备份表，用于测试后快速还原"""
+        with self.db_client.get_cursor(commit=True) as cursor:
+            for table in tables:
+                backup_table = backup_table_name(table, "seed", self._backup_token)
+                cursor.execute(f"DROP TABLE IF EXISTS {quote_identifier(backup_table)}")
+                cursor.execute(f"CREATE TABLE {quote_identifier(backup_table)} LIKE {quote_identifier(table)}")
+                cursor.execute(f"INSERT INTO {quote_identifier(backup_table)} SELECT * FROM {quote_identifier(table)}")
+                self._backups.append(table)
+                logger.info(f"已备份表: {table} -> {backup_table}")
+
+    def restore(self):
+        """从备份表还原数据并删除备份表"""
+        if not self._backups:
+            return
+
+        self.truncate(self._backups)
+        with self.db_client.get_cursor(commit=True) as cursor:
+            cursor.execute("SET FOREIGN_KEY_CHECKS = 0")
+            try:
+                for table in self._backups:
+                    backup_table = backup_table_name(table, "seed", self._backup_token)
+                    cursor.execute(f"INSERT INTO {quote_identifier(table)} SELECT * FROM {quote_identifier(backup_table)}")
+                    cursor.execute(f"DROP TABLE {quote_identifier(backup_table)}")
+                    logger.info(f"已还原表: {table}")
+            finally:
+                cursor.execute("SET FOREIGN_KEY_CHECKS = 1")
+        self._backups.clear()
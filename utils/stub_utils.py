@@ -0,0 +1,336 @@
+import argparse
+import asyncio
+import copy
+import itertools
+import json
+import os
+import random
+import threading
+import uuid
+from urllib.parse import urlsplit
+from utils.crypto_utils import CryptoUtils
+from utils.log_utils import logger
+
+# uvloop为可选依赖，安装后事件循环性能更高
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+# resource仅在类Unix系统可用，用于提高文件描述符上限
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# 默认桩服务配置，可在 config/env.yaml 的 stub 节点中覆盖
+DEFAULT_STUB_CONFIG = {
+    "host": "127.0.0.1",
+    "port": 0,                  # 0表示随机端口
+    "encrypt_enabled": True,    # 请求/响应使用与BaseAPI相同的AES信封（data + timestamp）
+    "backlog": 4096,            # 监听队列长度，支撑大量并发连接
+    "latency": 0,               # 注入的固定延迟（秒）
+    "latency_jitter": 0,        # 额外随机延迟上限（秒）
+    "error_rate": 0,            # 注入错误的比例（0~1）
+    "error_status": 500,        # 注入错误的HTTP状态码
+    "users": [                  # 预置用户，用户名/密码支持 ${环境变量}
+        {"username": "${TEST_USERNAME}", "password": "${TEST_PASSWORD}"},
+        {"username": "test_user", "password": "Test@123456"}
+    ],
+    "routes": {}                # 按接口覆盖：{login/get_user_info/register: {response, latency, latency_jitter, error_rate}}
+}
+
+BASE_PATH = "/api/v1/user"
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+            500: "Internal Server Error", 502: "Bad Gateway", 503: "Service Unavailable"}
+
+
+def _raise_nofile_limit():
+    """将文件描述符软上限提高到硬上限，否则数千并发连接会耗尽描述符"""
+    if resource is None:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard == resource.RLIM_INFINITY or soft < hard:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard if hard != resource.RLIM_INFINITY else 65536, hard))
+        except (ValueError, OSError) as e:
+            logger.warning(f"提高文件描述符上限失败: {str(e)}")
+
+
+class StubServer:
+    """用户接口的进程内桩服务（asyncio实现，单线程事件循环，支持HTTP/1.1长连接）
+
+    实现 POST /api/v1/user/login、GET /api/v1/user/{id}、POST /api/v1/user/register，
+    可配置固定响应、注入延迟和错误比例，用于在没有后端时调试用例及压测客户端
+    例：with StubServer({"latency": 0.01}) as server: UserAPI({**env_config, "base_url": server.base_url})
+    """
+
+    def __init__(self, config=None):
+        self.config = copy.deepcopy({**DEFAULT_STUB_CONFIG, **(config or {})})
+        self.config["routes"] = dict(self.config.get("routes") or {})
+        self.base_url = None
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._started = threading.Event()
+        self._error = None
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._users = {}    # 用户名 -> 用户信息
+        self._user_ids = {}  # 用户ID（字符串）-> 用户信息
+        self._tokens = {}   # token -> 用户名
+        self._stats = {"requests": 0, "errors": 0, "connections": 0, "active": 0, "max_active": 0, "routes": {}}
+        for user in self.config["users"]:
+            username = os.path.expandvars(str(user["username"]))
+            if "$" not in username:
+                self._add_user(username, os.path.expandvars(str(user["password"])), user.get("email"))
+
+    def _add_user(self, username, password, email=None):
+        user = {"id": next(self._ids), "username": username, "password": password,
+                "email": email or f"{username}@example.com"}
+        self._users[username] = self._user_ids[str(user["id"])] = user
+        return user
+
+    def set_route(self, route, **options):
+        """运行时覆盖接口行为：response（固定响应 {status, code, message, data}）、latency、latency_jitter、error_rate"""
+        with self._lock:
+            self.config["routes"][route] = {**self.config["routes"].get(route, {}), **options}
+
+    def reset_routes(self):
+        with self._lock:
+            self.config["routes"] = {}
+
+    def stats(self):
+        """请求数、注入错误数、连接数、最大并发连接数、按接口的请求数"""
+        with self._lock:
+            return {**self._stats, "routes": dict(self._stats["routes"])}
+
+    # ---------- 加解密信封 ----------
+
+    def _decode(self, body):
+        if not body:
+            return {}
+        payload = json.loads(body)
+        if self.config["encrypt_enabled"] and isinstance(payload, dict) and "data" in payload:
+            return json.loads(CryptoUtils.aes_decrypt(payload["data"]))
+        return payload
+
+    def _encode(self, code, message, data=None):
+        response = {"code": code, "message": message}
+        if data is not None:
+            if self.config["encrypt_enabled"]:
+                response["data"] = CryptoUtils.aes_encrypt(json.dumps(data, ensure_ascii=False))
+                response["timestamp"] = CryptoUtils.get_timestamp()
+            else:
+                response["data"] = data
+        return response
+
+    # ---------- 接口实现 ----------
+
+    def _login(self, request):
+        username, password = request.get("username"), request.get("password")
+        if not username:
+            return self._encode(400, "用户名不能为空")
+        user = self._users.get(username)
+        if user is None or user["password"] != password:
+            return self._encode(401, "用户名或密码错误")
+        token = uuid.uuid4().hex
+        self._tokens[token] = username
+        return self._encode(200, "success", {
+            "id": user["id"], "user_id": user["id"], "username": username, "token": token
+        })
+
+    def _get_user_info(self, user_id, headers):
+        token = headers.get("authorization", "").replace("Bearer ", "", 1)
+        if token not in self._tokens:
+            return self._encode(401, "未登录或token已失效")
+        user = self._user_ids.get(user_id)
+        if user is None:
+            return self._encode(404, "用户不存在")
+        return self._encode(200, "success", {"id": user["id"], "username": user["username"], "email": user["email"]})
+
+    def _register(self, request):
+        username, password = request.get("username") or "", request.get("password") or ""
+        if len(username) < 6:
+            return self._encode(400, "用户名长度不能少于6位")
+        if len(password) < 6:
+            return self._encode(400, "密码长度不能少于6位")
+        if username in self._users:
+            return self._encode(409, "用户名已存在")
+        user = self._add_user(username, password, request.get("email"))
+        return self._encode(200, "success", {"id": user["id"], "user_id": user["id"], "username": username})
+
+    def _route(self, method, path):
+        """返回 (接口名, 路径参数)，不存在返回 (None, None)"""
+        if not path.startswith(f"{BASE_PATH}/"):
+            return None, None
+        name = path[len(BASE_PATH) + 1:]
+        if method == "POST" and name in ("login", "register"):
+            return name, None
+        if method == "GET" and name and "/" not in name:
+            return "get_user_info", name
+        return None, None
+
+    async def _dispatch(self, method, path, headers, body):
+        """返回 (HTTP状态码, 响应体)"""
+        route, param = self._route(method, path)
+        if route is None:
+            return 404, {"code": 404, "message": "接口不存在"}
+        options = {**self.config, **self.config["routes"].get(route, {})}
+        with self._lock:
+            self._stats["requests"] += 1
+            self._stats["routes"][route] = self._stats["routes"].get(route, 0) + 1
+
+        delay = options["latency"] + random.uniform(0, options["latency_jitter"])
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if options["error_rate"] and random.random() < options["error_rate"]:
+            with self._lock:
+                self._stats["errors"] += 1
+            return options["error_status"], {"code": options["error_status"], "message": "服务异常（模拟）"}
+        if "response" in options:
+            response = options["response"]
+            return response.get("status", 200), self._encode(response.get("code", 200), response.get("message", "success"), response.get("data"))
+
+        try:
+            request = self._decode(body)
+        except (ValueError, KeyError) as e:
+            return 400, {"code": 400, "message": f"请求数据解析失败: {str(e)}"}
+        if route == "login":
+            return 200, self._login(request)
+        if route == "register":
+            return 200, self._register(request)
+        return 200, self._get_user_info(param, headers)
+
+    # ---------- HTTP/1.1 ----------
+
+    async def _handle(self, reader, writer):
+        with self._lock:
+            self._stats["connections"] += 1
+            self._stats["active"] += 1
+            self._stats["max_active"] = max(self._stats["max_active"], self._stats["active"])
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    break
+                lines = head.decode("latin-1").split("\r\n")
+                method, target, version = lines[0].split(" ", 2)
+                headers = {}
+                for line in lines[1:]:
+                    if line:
+                        name, _, value = line.partition(":")
+                        headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+                body = await reader.readexactly(length) if length else b""
+
+                status, payload = await self._dispatch(method.upper(), urlsplit(target).path, headers, body)
+                content = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+                writer.write(
+                    f"HTTP/1.1 {status} {_REASONS.get(status, 'Unknown')}\r\n"
+                    f"Content-Type: application/json; charset=utf-8\r\n"
+                    f"Content-Length: {len(content)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + content
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            # CancelledError：服务停止时关闭长连接
+            pass
+        except Exception as e:
+            logger.error(f"桩服务处理请求异常: {str(e)}")
+        finally:
+            with self._lock:
+                self._stats["active"] -= 1
+            writer.close()
+
+    # ---------- 启停 ----------
+
+    def _run(self):
+        self._loop = uvloop.new_event_loop() if uvloop else asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._server = self._loop.run_until_complete(asyncio.start_server(
+                self._handle, self.config["host"], self.config["port"], backlog=self.config["backlog"]
+            ))
+        except OSError as e:
+            self._error = e
+            self._started.set()
+            self._loop.close()
+            return
+        self._started.set()
+        try:
+            self._loop.run_until_complete(self._server.serve_forever())
+        except asyncio.CancelledError:
+            pass
+        finally:
+            # 关闭仍保持的长连接
+            tasks = asyncio.all_tasks(self._loop)
+            for task in tasks:
+                task.cancel()
+            self._loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            self._loop.run_until_complete(self._loop.shutdown_asyncgens())
+            self._loop.close()
+
+    def start(self):
+        """在后台线程启动服务，返回base_url"""
+        if self._thread is not None:
+            return self.base_url
+        _raise_nofile_limit()
+        self._thread = threading.Thread(target=self._run, name="stub-server", daemon=True)
+        self._thread.start()
+        self._started.wait()
+        if self._error:
+            self._thread = None
+            raise RuntimeError(f"桩服务启动失败: {str(self._error)}")
+        host, port = self._server.sockets[0].getsockname()[:2]
+        self.base_url = f"http://{host}:{port}"
+        logger.info(f"桩服务已启动: {self.base_url}（事件循环: {'uvloop' if uvloop else 'asyncio'}）")
+        return self.base_url
+
+    def stop(self, timeout=5):
+        if self._thread is None:
+            return
+        self._loop.call_soon_threadsafe(self._server.close)
+        self._thread.join(timeout)
+        self._thread = None
+        logger.info(f"桩服务已停止: {self.base_url}，统计: {self.stats()}")
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+def main(argv=None):
+    """命令行入口：python -m utils.stub_utils --port 8080 --latency 0.01 --error-rate 0.01"""
+    from utils.config_utils import load_env_config
+
+    parser = argparse.ArgumentParser(description="用户接口桩服务")
+    parser.add_argument("--env", default="test", help="读取该环境的stub配置：test（默认）/staging")
+    parser.add_argument("--host", help="监听地址")
+    parser.add_argument("--port", type=int, help="监听端口，默认随机")
+    parser.add_argument("--latency", type=float, help="注入的固定延迟（秒）")
+    parser.add_argument("--error-rate", type=float, dest="error_rate", help="注入错误的比例（0~1）")
+    args = parser.parse_args(argv)
+
+    config = dict(load_env_config(args.env).get("stub") or {})
+    config.update({key: value for key, value in vars(args).items() if key != "env" and value is not None})
+    server = StubServer(config)
+    server.start()
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+import heapq
+import random
+import threading
+import time
+from utils.log_utils import logger
+
+# 默认等待配置，可在 config/env.yaml 的 wait 节点中覆盖
+DEFAULT_WAIT_CONFIG = {
+    "timeout": 10,          # 超时时间（秒）
+    "initial_delay": 0.05,  # 首次重试间隔（秒）
+    "max_delay": 1.0,       # 最大重试间隔（秒）
+    "backoff": 2.0,         # 间隔递增倍数
+    "jitter": 0.2           # 随机抖动比例，避免多个等待同时轮询
+}
+
+_wait_config = dict(DEFAULT_WAIT_CONFIG)
+
+
+def configure_wait(config=None):
+    """更新默认等待配置"""
+    _wait_config.update(config or {})
+
+
+class ConsistencyMetrics:
+    """记录每类条件从开始等待到满足的耗时（最终一致时间），用于调整超时时间"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._records = {}  # 名称 -> {"elapsed": [...], "attempts": 累计尝试次数, "timeouts": 超时次数}
+
+    def record(self, name, elapsed, attempts, success):
+        with self._lock:
+            record = self._records.setdefault(name, {"elapsed": [], "attempts": 0, "timeouts": 0})
+            record["attempts"] += attempts
+            if success:
+                record["elapsed"].append(elapsed)
+            else:
+                record["timeouts"] += 1
+
+    def stats(self):
+        """按名称汇总：满足次数、超时次数、平均尝试次数、耗时p50/p95/max（秒）"""
+        result = {}
+        with self._lock:
+            for name, record in self._records.items():
+                elapsed = sorted(record["elapsed"])
+                total = len(elapsed) + record["timeouts"]
+                result[name] = {
+                    "count": len(elapsed),
+                    "timeouts": record["timeouts"],
+                    "attempts_avg": round(record["attempts"] / total, 1) if total else 0,
+                    "p50": round(elapsed[int(len(elapsed) * 0.5)], 3) if elapsed else 0,
+                    "p95": round(elapsed[min(len(elapsed) - 1, int(len(elapsed) * 0.95))], 3) if elapsed else 0,
+                    "max": round(elapsed[-1], 3) if elapsed else 0
+                }
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+
+
+# 全局最终一致时间统计
+consistency_metrics = ConsistencyMetrics()
+
+
+class Condition:
+    """等待条件：check() 不抛出可重试异常且返回值不为False即视为满足，返回值作为结果
+
+    其他异常（如SQL语法错误）立即失败，不再重试
+    """
+
+    def __init__(self, check, name=None, timeout=None, retry_on=(AssertionError, TimeoutError), **options):
+        self.check = check
+        self.name = name or getattr(check, "__name__", "condition")
+        self.retry_on = retry_on
+        self.options = {**_wait_config, **options}
+        if timeout is not None:
+            self.options["timeout"] = timeout
+        self.attempts = 0
+        self.last_error = None
+
+    def attempt(self):
+        """执行一次检查，返回 (是否满足, 结果)"""
+        self.attempts += 1
+        try:
+            result = self.check()
+        except self.retry_on as e:
+            self.last_error = e
+            return False, None
+        if result is False:
+            self.last_error = AssertionError("条件返回False")
+            return False, None
+        return True, result
+
+    def next_delay(self):
+        """指数退避 + 随机抖动"""
+        options = self.options
+        delay = min(options["max_delay"], options["initial_delay"] * options["backoff"] ** (self.attempts - 1))
+        return delay * (1 + random.uniform(-options["jitter"], options["jitter"]))
+
+
+def wait_all(conditions, timeout=None):
+    """单个调度循环同时等待多个条件，每个条件独立退避和超时，满足即不再检查
+
+    全部满足时按传入顺序返回结果列表；有条件超时则抛出AssertionError，列出所有未满足的条件
+    """
+    conditions = [c if isinstance(c, Condition) else Condition(c) for c in conditions]
+    start = time.monotonic()
+    deadlines = []
+    schedule = []
+    for index, condition in enumerate(conditions):
+        deadlines.append(start + (timeout if timeout is not None else condition.options["timeout"]))
+        schedule.append((start, index))
+    heapq.heapify(schedule)
+
+    results = [None] * len(conditions)
+    failed = []
+    while schedule:
+        due, index = heapq.heappop(schedule)
+        now = time.monotonic()
+        if due > now:
+            time.sleep(due - now)
+
+        condition = conditions[index]
+        satisfied, result = condition.attempt()
+        now = time.monotonic()
+        if satisfied:
+            results[index] = result
+            consistency_metrics.record(condition.name, now - start, condition.attempts, True)
+            logger.debug(f"条件已满足: {condition.name}, 耗时={now - start:.3f}s, 尝试{condition.attempts}次")
+        elif now >= deadlines[index]:
+            failed.append(condition)
+            consistency_metrics.record(condition.name, now - start, condition.attempts, False)
+        else:
+            # 最后一次检查落在超时时刻
+            heapq.heappush(schedule, (min(now + condition.next_delay(), deadlines[index]), index))
+
+    if failed:
+        message = "；".join(
+            f"{c.name}（超时{c.options['timeout'] if timeout is None else timeout}s，尝试{c.attempts}次）: {c.last_error}"
+            for c in failed
+        )
+        logger.error(f"等待条件超时: {message}")
+        raise AssertionError(f"等待条件超时: {message}")
+    return results
+
+
+def eventually(check, timeout=None, name=None, **options):
+    """重复检查直到满足或超时（指数退避 + 抖动），返回check()的结果
+
+    例：eventually(lambda: assert_redis_key_exists(redis_client, key), timeout=5, name="redis_key")
+    """
+    return wait_all([Condition(check, name=name, timeout=timeout, **options)])[0]